@@ -0,0 +1,47 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+
+import signal
+from sys import exit
+from app import APP_CONFIG, get_database_client, logger
+from commons.amqp_consumer import AmqpConsumer, create_pika_connection_factory
+from utils import utils
+
+
+def start_amqp_consumer():
+    consumer = AmqpConsumer(get_database_client(),
+                            create_pika_connection_factory(APP_CONFIG["amqpUrl"]),
+                            exchange_name=APP_CONFIG["amqpExchangeName"],
+                            queue_name=APP_CONFIG["amqpQueueName"],
+                            prefetch_count=APP_CONFIG["amqpPrefetchCount"],
+                            ack_batch_size=APP_CONFIG["amqpAckBatchSize"],
+                            consumer_threads=APP_CONFIG["amqpConsumerThreads"],
+                            max_retries=APP_CONFIG["amqpMaxRetries"],
+                            retry_delay=APP_CONFIG["amqpRetryDelay"])
+    logger.info("AMQP Url %s", utils.remove_credentials_from_url(APP_CONFIG["amqpUrl"]))
+    consumer.start()
+    signal.sigwait([signal.SIGINT, signal.SIGTERM])
+    consumer.stop()
+
+
+if __name__ == '__main__':
+    logger.info("AMQP consumer started")
+    signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGINT, signal.SIGTERM])
+
+    start_amqp_consumer()
+
+    logger.info("The AMQP consumer has finished")
+    exit(0)
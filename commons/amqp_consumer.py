@@ -0,0 +1,191 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import json
+import logging
+import threading
+import pika
+import pika.exceptions
+from time import time
+from commons.ingest_queue import validate_index_query
+
+logger = logging.getLogger("esLogsService.amqpConsumer")
+
+CONSUMED_METHODS = ["index_logs", "delete_logs", "delete_logs_by_date"]
+RETRIES_HEADER = "x-retries"
+
+
+class TransientError(Exception):
+    """Raised when a message can be processed again later, e.g. while the database is unavailable"""
+
+
+class PermanentError(Exception):
+    """Raised when processing a message again won't help, it's moved to the dead-letter queue"""
+
+
+def create_pika_connection_factory(amqp_url):
+    def connection_factory():
+        return pika.BlockingConnection(pika.URLParameters(amqp_url))
+    return connection_factory
+
+
+class AmqpConsumer:
+    """Consumes log operations from RabbitMQ and dispatches them to the database client.
+
+    The operation is taken from the message type property or, if it's absent, from
+    the routing key. connection_factory returns an object with a pika-like channel(),
+    so an in-memory broker stand-in can replace RabbitMQ.
+
+    A message failed transiently is published to the queue again after retry_delay, at most
+    max_retries times. Malformed and partially written messages, and those out of retries,
+    are published to the dead-letter queue. Messages are acked only after that, so every
+    message is either processed or kept in one of the queues."""
+    def __init__(self, database_client, connection_factory, exchange_name="logs",
+                 queue_name="logs", prefetch_count=100, ack_batch_size=50,
+                 ack_interval=1.0, consumer_threads=4, reconnect_delay=5.0,
+                 max_retries=5, retry_delay=5.0):
+        self.database_client = database_client
+        self.connection_factory = connection_factory
+        self.exchange_name = exchange_name
+        self.queue_name = queue_name
+        self.prefetch_count = prefetch_count
+        self.ack_batch_size = min(ack_batch_size, prefetch_count)
+        self.ack_interval = ack_interval
+        self.consumer_threads = consumer_threads
+        self.reconnect_delay = reconnect_delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.dead_letter_queue_name = f"{queue_name}.dead"
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def dispatch(self, method, body):
+        """Processes a message, raises TransientError or PermanentError if it wasn't processed"""
+        if method not in CONSUMED_METHODS:
+            raise PermanentError(f"Unsupported method '{method}'")
+        try:
+            request_data = json.loads(body, strict=False)
+        except ValueError as err:
+            raise PermanentError(f"Malformed message: {err}")
+        if method == "index_logs":
+            error = validate_index_query(request_data)
+            if error is not None:
+                raise PermanentError(error)
+            request_data["report_errors"] = True
+        try:
+            result = getattr(self.database_client, method)(request_data)
+        except Exception as err:
+            raise TransientError(str(err))
+        if method == "index_logs":
+            self.check_indexed(request_data, result)
+        return result
+
+    @staticmethod
+    def check_indexed(index_query, result):
+        """The database clients return the written count instead of raising,
+        nothing written is retried, a partial write can't be retried without duplicates"""
+        errors = []
+        if isinstance(result, dict):
+            errors = result.get("errors") or []
+            result = result["indexed"]
+        logs_count = len(index_query["logs"])
+        if logs_count and not result:
+            raise TransientError(f"None of {logs_count} logs were written")
+        if errors or result < logs_count:
+            raise PermanentError(f"{result} of {logs_count} logs were written, errors: {errors[:10]}")
+
+    def publish(self, channel, routing_key, method, body, properties, retries):
+        headers = dict(getattr(properties, "headers", None) or {})
+        headers[RETRIES_HEADER] = retries
+        channel.basic_publish(exchange="", routing_key=routing_key, body=body,
+                              properties=pika.BasicProperties(type=method, headers=headers, delivery_mode=2))
+
+    def handle_failure(self, channel, method, body, properties, err):
+        """Publishes a failed message for a retry or to the dead-letter queue"""
+        retries = (getattr(properties, "headers", None) or {}).get(RETRIES_HEADER, 0)
+        if isinstance(err, TransientError) and retries < self.max_retries:
+            logger.warning("Retrying '%s' message in %.1f s, attempt %d: %s",
+                           method, self.retry_delay, retries + 1, err)
+            # keeps an outage from spinning through the retries
+            self.stopped.wait(self.retry_delay)
+            self.publish(channel, self.queue_name, method, body, properties, retries + 1)
+            return
+        logger.error("Moving '%s' message to %s: %s", method, self.dead_letter_queue_name, err)
+        self.publish(channel, self.dead_letter_queue_name, method, body, properties, retries)
+
+    def declare(self, channel):
+        channel.exchange_declare(exchange=self.exchange_name, exchange_type="direct", durable=True)
+        channel.queue_declare(queue=self.queue_name, durable=True)
+        channel.queue_declare(queue=self.dead_letter_queue_name, durable=True)
+        for method in CONSUMED_METHODS:
+            channel.queue_bind(queue=self.queue_name, exchange=self.exchange_name, routing_key=method)
+        channel.basic_qos(prefetch_count=self.prefetch_count)
+
+    def consume(self, channel):
+        """Processes messages until stopped, acknowledging them in batches"""
+        last_delivery_tag = None
+        unacked_count = 0
+        last_ack_time = time()
+        for method_frame, properties, body in channel.consume(
+                self.queue_name, inactivity_timeout=self.ack_interval):
+            if method_frame is not None:
+                method = properties.type or method_frame.routing_key
+                try:
+                    self.dispatch(method, body)
+                except (TransientError, PermanentError) as err:
+                    self.handle_failure(channel, method, body, properties, err)
+                # a failed message is acked once it's published again
+                last_delivery_tag = method_frame.delivery_tag
+                unacked_count += 1
+            ack_due = method_frame is None or unacked_count >= self.ack_batch_size
+            if last_delivery_tag is not None and (ack_due or time() - last_ack_time >= self.ack_interval):
+                channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+                last_delivery_tag = None
+                unacked_count = 0
+                last_ack_time = time()
+            if self.stopped.is_set():
+                break
+        if last_delivery_tag is not None:
+            channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+        channel.cancel()
+
+    def run_consumer(self):
+        while not self.stopped.is_set():
+            connection = None
+            try:
+                connection = self.connection_factory()
+                channel = connection.channel()
+                self.declare(channel)
+                self.consume(channel)
+            except pika.exceptions.AMQPError as err:
+                logger.error("AMQP connection error, reconnecting in %.1f s", self.reconnect_delay)
+                logger.error(err)
+                self.stopped.wait(self.reconnect_delay)
+            finally:
+                if connection is not None and connection.is_open:
+                    connection.close()
+
+    def start(self):
+        for idx in range(self.consumer_threads):
+            thread = threading.Thread(target=self.run_consumer, name=f"amqp-consumer-{idx}")
+            thread.start()
+            self.threads.append(thread)
+        logger.info("Started %d AMQP consumers for queue %s", self.consumer_threads, self.queue_name)
+
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        logger.info("Stopped AMQP consumers")
@@ -14,19 +14,30 @@
 * limitations under the License.
 """
 
+import copy
 import logging
 import elasticsearch
 import elasticsearch.helpers
-import requests
-import json
+import threading
+import uuid
 
 from utils import utils
-from time import time
-from commons.launch_objects import Log
+from itertools import islice
+from time import sleep, time
+from commons.es_connections import InFlightConnection, get_node_metrics, get_selector_class
+from commons.launch_objects import LogRow, get_max_message_chars, get_requested_fields
+from commons.metrics import BULK_ITEMS, STAGE_LATENCY
 
 logger = logging.getLogger("esLogsService.esClient")
 
 
+MAX_RESULT_WINDOW = 10000
+BULK_REQUEST_TIMEOUT = 30
+
+PAGE_SORT = [{"_score": "desc"}, {"uuid": "asc"}]
+
+SEARCH_HIGHLIGHT = {"fields": {"log_message": {"fragment_size": 150, "number_of_fragments": 3}}}
+
 BASIC_POLICY = {
     "phases": {
         "hot": {"actions": {"rollover": {"max_age": "7d"}}},
@@ -44,12 +55,7 @@ BASIC_TEMPLATE = {
             "log_message": {
                 "type": "text",
                 "analyzer": "standard",
-                "fields": {
-                    "no_tokenization": {
-                        "type": "text",
-                        "analyzer": "keyword",
-                    }
-                }
+                "index_options": "offsets",
             },
             "item_id": {"type": "integer"},
             "launch_id": {"type": "integer"},
@@ -60,18 +66,70 @@ BASIC_TEMPLATE = {
     },
 }
 
+# sub-fields of log_message serving pattern searches and the field the regexp runs on:
+# "keyword" keeps whole messages as single tokens, "wildcard" indexes n-grams of messages
+# and verifies the matches, "none" runs the regexp on the tokens of log_message
+PATTERN_FIELDS = {
+    "keyword": ({"no_tokenization": {"type": "text", "analyzer": "keyword"}}, "log_message.no_tokenization"),
+    "wildcard": ({"wildcard": {"type": "wildcard"}}, "log_message.wildcard"),
+    "none": ({}, "log_message"),
+}
+
+TEMPLATE_OPTIONS = ["number_of_shards", "number_of_replicas", "refresh_interval", "codec", "pattern_field"]
+
 
 class EsClient:
     """Elasticsearch client implementation"""
     def __init__(self, app_config={}):
         self.app_config = app_config
         self.host = app_config["esHost"]
+        self.hosts = [host.strip().strip("/") for host in self.host.split(",") if host.strip()]
         self.es_client = self.create_es_client()
+        self.index_cache_ttl = app_config.get("esIndexCacheTtl", 60)
+        self.known_indices = {}
+        self.known_indices_lock = threading.Lock()
+        self.shared_projects = {}
+        self.promotion_checks = {}
+        self.promoting_projects = set()
+        self.promotion_lock = threading.Lock()
 
     def create_es_client(self):
+        """Creates the client all requests go through, its transport keeps a pool of
+        persistent connections per node and can discover the other nodes of the cluster"""
         return elasticsearch.Elasticsearch(
-            [self.host], timeout=30,
-            max_retries=5, retry_on_timeout=True)
+            self.hosts,
+            timeout=self.app_config.get("esTimeout", 30),
+            max_retries=self.app_config.get("esMaxRetries", 5),
+            retry_on_timeout=True,
+            maxsize=self.app_config.get("esPoolSize", 10),
+            http_compress=self.app_config.get("esHttpCompress", True),
+            sniff_on_start=self.app_config.get("esSniffOnStart", False),
+            sniff_on_connection_fail=self.app_config.get("esSniffOnConnectionFail", False),
+            sniffer_timeout=self.app_config.get("esSnifferTimeout") or None,
+            http_auth=utils.get_credentials_from_url(self.hosts[0]) if self.hosts else None,
+            connection_class=InFlightConnection,
+            selector_class=get_selector_class(self.app_config.get("esSelector", "round_robin")),
+            dead_timeout=self.app_config.get("esDeadTimeout", 60))
+
+    def get_node_metrics(self):
+        return get_node_metrics(self.es_client.transport.connection_pool)
+
+    def get_read_preference(self, project):
+        """Returns the search preference of a project: "project" keeps the reads of a project
+        on the same shard copies, so their caches stay warm, other values are passed as is"""
+        preference = self.app_config.get("esReadPreference", "")
+        if preference == "project":
+            return f"project_{project}"
+        return preference or None
+
+    def perform_request(self, method, path, body=None, params=None):
+        """Sends a request through the client transport, returns its status code and body"""
+        try:
+            return {"status_code": 200,
+                    "body": self.es_client.transport.perform_request(method, path, body=body, params=params)}
+        except elasticsearch.TransportError as err:
+            return {"status_code": err.status_code if isinstance(err.status_code, int) else None,
+                    "body": err.info if isinstance(err.info, dict) else {"error": str(err.info or err.error)}}
 
     def get_index_name(self, project_id):
         return f"{self.app_config['esIndexPrefix']}{project_id}_logs"
@@ -82,28 +140,70 @@ class EsClient:
     def get_policy_name(self, index_name):
         return f"{index_name}_policy"
 
+    def get_shared_index_name(self):
+        return self.app_config.get("esSharedIndexName") or f"{self.app_config['esIndexPrefix']}shared_logs"
+
+    def get_log_target(self, project):
+        """Returns the index of the logs of a project and the routing to use with it.
+        In shared index mode projects without a dedicated index share one index,
+        their logs are routed and filtered by project, otherwise the routing is None"""
+        es_index_name = self.get_index_name(project)
+        if not self.app_config.get("esSharedIndex"):
+            return es_index_name, None
+        with self.known_indices_lock:
+            expires_at = self.shared_projects.get(str(project))
+        if expires_at is not None and expires_at > time():
+            return self.get_shared_index_name(), str(project)
+        if self.index_exists(es_index_name, print_error=False):
+            return es_index_name, None
+        with self.known_indices_lock:
+            self.shared_projects[str(project)] = time() + self.index_cache_ttl
+        return self.get_shared_index_name(), str(project)
+
+    def filter_by_project(self, query, routing):
+        """Restricts a query to the project of the routing, queries of dedicated indices are kept"""
+        if routing is None:
+            return query
+        return dict(query, query={"bool": {"filter": [{"term": {"project": routing}}],
+                                           "must": [query.get("query", {"match_all": {}})]}})
+
+    def cache_index(self, es_index_name):
+        with self.known_indices_lock:
+            self.known_indices[es_index_name] = time() + self.index_cache_ttl
+
+    def invalidate_index_cache(self, es_index_name):
+        with self.known_indices_lock:
+            self.known_indices.pop(es_index_name, None)
+
     def index_exists(self, es_index_name, print_error=True):
-        """Checks whether index exists"""
+        """Checks whether index or alias exists, known ones are cached for a while"""
+        with self.known_indices_lock:
+            expires_at = self.known_indices.get(es_index_name)
+        if expires_at is not None and expires_at > time():
+            return True
         try:
-            index = self.es_client.indices.get(index=es_index_name)
-            return index is not None
+            exists = self.es_client.indices.exists(index=es_index_name)
         except Exception as err:
             if print_error:
                 logger.error("Index %s was not found", es_index_name)
-                logger.error("ES Url %s", self.host)
+                logger.error("ES Url %s", utils.remove_credentials_from_url(self.host))
                 logger.error(err)
             return False
+        if exists:
+            self.cache_index(es_index_name)
+        elif print_error:
+            logger.error("Index %s was not found", es_index_name)
+        return exists
 
     def log_response(self, response, success_message, error_message):
         if response["status_code"] == 200:
             logger.debug(success_message)
         else:
-            response_content = json.loads(response["_content"])
-            if isinstance(response_content["error"], dict)\
-                    and "root_cause" in response_content["error"]:
-                reason = response_content["error"]["root_cause"][0]["reason"]
+            error = response["body"].get("error", response["body"])
+            if isinstance(error, dict) and error.get("root_cause"):
+                reason = error["root_cause"][0]["reason"]
             else:
-                reason = response_content["error"]
+                reason = error
             logger.error(
                 "%s: %s",
                 error_message,
@@ -111,19 +211,24 @@ class EsClient:
             )
 
     def delete_project(self, project_id):
-        """Delete the whole index"""
+        """Delete the whole index, in shared index mode the logs of the project in the shared index too"""
         es_index_name = self.get_index_name(project_id)
-        if self.index_exists(es_index_name):
+        deleted = 0
+        if self.app_config.get("esSharedIndex") and self.index_exists(self.get_shared_index_name(),
+                                                                      print_error=False):
+            self.delete_logs_by_query(self.get_shared_index_name(), {"term": {"project": str(project_id)}},
+                                      {"wait_for_completion": True}, routing=str(project_id))
+            with self.known_indices_lock:
+                self.shared_projects.pop(str(project_id), None)
+            deleted = 1
+        if self.index_exists(es_index_name, print_error=not deleted):
             try:
                 self.es_client.indices.delete(index=es_index_name + "*")
-                delete_template_response = requests.delete(
-                    f"{self.host}/_index_template/{self.get_template_name(es_index_name)}",
-                    headers={"Content-type": "application/json", "Accept": "text/plain"}
-                ).__dict__
-                delete_policy_response = requests.delete(
-                    f"{self.host}/_ilm/policy/{self.get_policy_name(es_index_name)}",
-                    headers={"Content-type": "application/json", "Accept": "text/plain"}
-                ).__dict__
+                self.invalidate_index_cache(es_index_name)
+                delete_template_response = self.perform_request(
+                    "DELETE", f"/_index_template/{self.get_template_name(es_index_name)}")
+                delete_policy_response = self.perform_request(
+                    "DELETE", f"/_ilm/policy/{self.get_policy_name(es_index_name)}")
                 logger.info("ES Url %s", utils.remove_credentials_from_url(self.host))
                 self.log_response(
                     response=delete_template_response,
@@ -141,25 +246,145 @@ class EsClient:
                 logger.error("Not found %s for deleting", es_index_name)
                 logger.error("ES Url %s", utils.remove_credentials_from_url(self.host))
                 logger.error(err)
-                return 0
-        return 0
+        return deleted
 
-    def get_logs_by_query(self, project, query, max_num=100):
-        es_index_name = self.get_index_name(project)
+    def get_log_options(self, read_request):
+        """Returns how logs of a read request are built from hits"""
+        return {"fields": get_requested_fields(read_request),
+                "max_message_chars": get_max_message_chars(read_request)}
+
+    def transform_hit_to_log(self, hit, fields=None, max_message_chars=None):
+        log = LogRow.from_dict(hit.get("_source", {}), fields=fields)
+        log.id = hit["_id"]
+        if max_message_chars is not None and log.log_message is not None:
+            log.log_message = log.log_message[:max_message_chars]
+        if "highlight" in hit:
+            log.highlight = hit["highlight"].get("log_message", [])
+        return log
+
+    def scroll_hits(self, es_index_name, query, max_num=None, routing=None, preference=None):
+        """Scrolls through hits for full exports, the scroll context is always cleared"""
+        hits = elasticsearch.helpers.scan(self.es_client, query=query, index=es_index_name,
+                                          routing=routing, preference=preference)
+        try:
+            for idx, hit in enumerate(hits):
+                if max_num is not None and idx >= max_num:
+                    break
+                yield hit
+        finally:
+            hits.close()
+
+    def page_hits(self, es_index_name, query, page_size, max_num=None, routing=None, preference=None):
+        """Yields hits read page by page from a point in time with search_after,
+        so only one page is held in memory, the point in time is always closed"""
+        pit_id = self.open_point_in_time(es_index_name, routing=routing, preference=preference)
+        body = dict(query, sort=PAGE_SORT)
+        returned = 0
+        try:
+            while max_num is None or returned < max_num:
+                body["size"] = page_size if max_num is None else min(page_size, max_num - returned)
+                body["pit"] = {"id": pit_id, "keep_alive": self.app_config.get("esPitKeepAlive", "1m")}
+                with STAGE_LATENCY.labels("db").time():
+                    response = self.es_client.search(body=body)
+                hits = response["hits"]["hits"]
+                pit_id = response.get("pit_id", pit_id)
+                yield from hits
+                returned += len(hits)
+                if len(hits) < body["size"]:
+                    break
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            self.close_point_in_time(pit_id)
+
+    def iter_logs_by_query(self, project, query, max_num=100, log_options=None, page_size=None):
+        """Yields logs of a query, bounded queries are served with a single search request
+        unless a page size is given, then logs are streamed reading a page at a time"""
+        es_index_name, routing = self.get_log_target(project)
         if not self.index_exists(es_index_name):
-            return []
+            return
+        query = self.filter_by_project(query, routing)
         start_time = time()
-        logs = []
-        for res in elasticsearch.helpers.scan(self.es_client,
-                                              query=query,
-                                              index=es_index_name):
-            log = Log(**res["_source"])
-            log.id = res["_id"]
-            logs.append(log)
-            if len(logs) >= max_num:
-                break
+        try:
+            if page_size is not None:
+                hits = self.page_hits(es_index_name, query, page_size, max_num=max_num, routing=routing,
+                                      preference=self.get_read_preference(project))
+            elif max_num is not None and max_num <= MAX_RESULT_WINDOW:
+                body = dict(query, size=max_num)
+                with STAGE_LATENCY.labels("db").time():
+                    hits = self.es_client.search(
+                        index=es_index_name, body=body, routing=routing,
+                        preference=self.get_read_preference(project))["hits"]["hits"]
+            else:
+                hits = self.scroll_hits(es_index_name, query, max_num=max_num, routing=routing,
+                                        preference=self.get_read_preference(project))
+            for hit in hits:
+                yield self.transform_hit_to_log(hit, **(log_options or {}))
+        except elasticsearch.NotFoundError:
+            logger.warning("Index %s disappeared, dropping it from the cache", es_index_name)
+            self.invalidate_index_cache(es_index_name)
+            return
         logger.info("Finished querying for %.2f s", time() - start_time)
-        return logs
+
+    def get_logs_by_query(self, project, query, max_num=100, log_options=None):
+        return list(self.iter_logs_by_query(project, query, max_num=max_num, log_options=log_options))
+
+    def open_point_in_time(self, es_index_name, routing=None, preference=None):
+        params = {"keep_alive": self.app_config.get("esPitKeepAlive", "1m")}
+        if routing is not None:
+            params["routing"] = routing
+        if preference:
+            params["preference"] = preference
+        return self.es_client.transport.perform_request("POST", f"/{es_index_name}/_pit", params=params)["id"]
+
+    def close_point_in_time(self, pit_id):
+        try:
+            self.es_client.transport.perform_request("DELETE", "/_pit", body={"id": pit_id})
+        except elasticsearch.TransportError as err:
+            logger.debug("Unable to close point in time: %s", err)
+
+    def filter_page_by_project(self, query, project):
+        """Restricts a page query to the logs of a project whatever index the point in time covers:
+        the project may be promoted between pages, so pages keep the shared index logs of the project
+        and the logs of dedicated indices, which carry no project"""
+        return dict(query, query={"bool": {
+            "filter": [{"bool": {"should": [{"term": {"project": project}},
+                                            {"bool": {"must_not": {"exists": {"field": "project"}}}}],
+                                 "minimum_should_match": 1}}],
+            "must": [query.get("query", {"match_all": {}})]}})
+
+    def get_logs_page(self, project, query, limit, cursor=None, log_options=None):
+        """Returns a page of logs and the cursor of the next one, pages are read
+        from a point in time with search_after, so deep pages cost as much as the first one"""
+        es_index_name, routing = self.get_log_target(project)
+        if cursor is not None:
+            page_state = utils.decode_cursor(cursor)
+            if page_state.get("project") != str(project):
+                raise ValueError("The cursor belongs to another project")
+        elif self.index_exists(es_index_name):
+            page_state = {"pit": self.open_point_in_time(
+                es_index_name, routing=routing, preference=self.get_read_preference(project))}
+        else:
+            return [], None
+        if self.app_config.get("esSharedIndex"):
+            query = self.filter_page_by_project(query, str(project))
+        body = dict(query, size=limit, sort=PAGE_SORT, pit={
+            "id": page_state["pit"], "keep_alive": self.app_config.get("esPitKeepAlive", "1m")})
+        if "search_after" in page_state:
+            body["search_after"] = page_state["search_after"]
+        try:
+            with STAGE_LATENCY.labels("db").time():
+                response = self.es_client.search(body=body)
+        except elasticsearch.NotFoundError:
+            raise ValueError("The cursor has expired")
+        hits = response["hits"]["hits"]
+        with STAGE_LATENCY.labels("objects").time():
+            logs = [self.transform_hit_to_log(hit, **(log_options or {})) for hit in hits]
+        pit_id = response.get("pit_id", page_state["pit"])
+        if len(hits) < limit:
+            self.close_point_in_time(pit_id)
+            return logs, None
+        return logs, utils.encode_cursor(
+            {"pit": pit_id, "search_after": hits[-1]["sort"], "project": str(project)})
 
     def get_ids_query(self, ids):
         return {
@@ -171,87 +396,269 @@ class EsClient:
             }
         }
 
-    def get_logs_by_ids(self, logs_request):
-        return self.get_logs_by_query(
-            logs_request["project"], self.get_ids_query(logs_request["ids"]))
-
-    def get_logs_by_test_item(self, logs_request):
-        return self.get_logs_by_query(logs_request["project"], {
+    def get_test_item_query(self, test_item):
+        return {
             "size": 1000,
             "query": {
                 "bool": {
                     "filter": [
-                        {"term": {"item_id": logs_request["test_item"]}}
+                        {"term": {"item_id": test_item}}
                     ]
                 }
             }
-        })
+        }
+
+    def iter_logs_by_ids(self, logs_request):
+        query, limit = self.get_read_query("get_logs_by_ids", logs_request)
+        return self.iter_logs_by_query(logs_request["project"], query, max_num=limit,
+                                       log_options=self.get_log_options(logs_request),
+                                       page_size=self.app_config.get("esStreamPageSize", 100))
+
+    def get_logs_by_ids(self, logs_request):
+        query, limit = self.get_read_query("get_logs_by_ids", logs_request)
+        return self.get_logs_by_query(logs_request["project"], query, max_num=limit,
+                                      log_options=self.get_log_options(logs_request))
+
+    def iter_logs_by_test_item(self, logs_request):
+        query, limit = self.get_read_query("get_logs_by_test_item", logs_request)
+        return self.iter_logs_by_query(logs_request["project"], query, max_num=limit,
+                                       log_options=self.get_log_options(logs_request),
+                                       page_size=self.app_config.get("esStreamPageSize", 100))
+
+    def get_logs_by_test_item(self, logs_request):
+        query, limit = self.get_read_query("get_logs_by_test_item", logs_request)
+        return self.get_logs_by_query(logs_request["project"], query, max_num=limit,
+                                      log_options=self.get_log_options(logs_request))
 
-    def _bulk_index(self, bodies, refresh=True, es_chunk_number=1000):
+    def get_refresh_policy(self, refresh=None):
+        default_refresh = self.app_config.get("esBulkRefresh", "wait_for")
+        refresh = str(default_refresh if refresh is None else refresh).lower()
+        if refresh not in ["true", "false", "wait_for"]:
+            logger.warning("Unknown refresh policy '%s', using '%s'", refresh, default_refresh)
+            refresh = default_refresh
+        return refresh
+
+    def _bulk_index(self, bodies, refresh=None, require_alias=False, missing=None):
+        """Indexes bodies with parallel bulk requests, returns success count and failed items.
+        With require_alias the target has to be an alias, if a missing list is given the positions
+        of bodies failed because of a missing alias are added to it instead of the failed items"""
         if not bodies:
-            return 0
+            return 0, []
+        refresh = self.get_refresh_policy(refresh)
         start_time = time()
         logger.debug("Indexing %d logs...", len(bodies))
+        success_count = 0
+        errors = []
         try:
-            success_count, errors = elasticsearch.helpers.bulk(self.es_client,
-                                                               bodies,
-                                                               chunk_size=es_chunk_number,
-                                                               request_timeout=30,
-                                                               refresh=refresh)
+            results = elasticsearch.helpers.parallel_bulk(
+                self.es_client,
+                bodies,
+                thread_count=self.app_config.get("esBulkThreadCount", 4),
+                chunk_size=self.app_config.get("esBulkChunkSize", 1000),
+                max_chunk_bytes=self.app_config.get("esBulkMaxChunkBytes", 10 * 1024 * 1024),
+                raise_on_error=False,
+                raise_on_exception=False,
+                request_timeout=BULK_REQUEST_TIMEOUT,
+                refresh="false" if refresh == "true" else refresh,
+                params={"require_alias": "true"} if require_alias else {})
+            # parallel bulk keeps the order of bodies
+            for position, (ok, item) in enumerate(results):
+                if ok:
+                    success_count += 1
+                    continue
+                op_type, result = next(iter(item.items()))
+                error = result.get("error")
+                if missing is not None and isinstance(error, dict) \
+                        and error.get("type") == "index_not_found_exception":
+                    missing.append(position)
+                    continue
+                errors.append({
+                    "op_type": op_type,
+                    "id": result.get("_id"),
+                    "status": result.get("status"),
+                    "error": result.get("error"),
+                })
+            if refresh == "true":
+                self.es_client.indices.refresh(index=",".join({body["_index"] for body in bodies}))
+            BULK_ITEMS.labels("success").inc(success_count)
+            BULK_ITEMS.labels("error").inc(len(errors))
             logger.debug("Processed %d logs", success_count)
             if errors:
                 logger.debug("Occurred errors %s", errors)
             logger.debug("Finished indexing for %.2f s", time() - start_time)
-            return success_count
+            return success_count, errors
         except Exception as err:
             logger.error("Error in bulk")
             logger.error("ES Url %s", utils.remove_credentials_from_url(self.host))
             logger.error(err)
+            return 0, []
+
+    def delete_logs_by_query(self, es_index_name, query, logs_request, routing=None):
+        """Deletes logs matching a query server-side. Unless the request waits for completion,
+        returns the id of the deletion task, its progress is reported by get_task"""
+        wait_for_completion = bool(logs_request.get(
+            "wait_for_completion", self.app_config.get("esDeleteWaitForCompletion", False)))
+        try:
+            response = self.es_client.delete_by_query(
+                index=es_index_name,
+                body=self.filter_by_project({"query": query}, routing),
+                routing=routing,
+                conflicts="proceed",
+                refresh=self.get_refresh_policy(logs_request.get("refresh")) != "false",
+                slices=logs_request.get("slices", self.app_config.get("esDeleteSlices", "auto")),
+                requests_per_second=logs_request.get(
+                    "requests_per_second", self.app_config.get("esDeleteRequestsPerSecond", -1)),
+                wait_for_completion=wait_for_completion,
+                request_timeout=self.app_config.get("esDeleteTimeout", 300))
+        except elasticsearch.NotFoundError:
+            self.invalidate_index_cache(es_index_name)
+            return 0
+        except Exception as err:
+            logger.error("Unable to delete logs from %s", es_index_name)
+            logger.error("ES Url %s", utils.remove_credentials_from_url(self.host))
+            logger.error(err)
             return 0
+        if not wait_for_completion:
+            logger.debug("Started deletion task %s for %s", response["task"], es_index_name)
+            return {"task": response["task"]}
+        if response.get("failures"):
+            logger.error("Failures while deleting logs from %s: %s", es_index_name, response["failures"])
+        logger.debug("Deleted %d logs from %s", response.get("deleted", 0), es_index_name)
+        return response.get("deleted", 0)
 
-    def delete_logs(self, logs_request):
-        es_index_name = self.get_index_name(logs_request["project"])
+    def get_task(self, task_id):
+        """Returns the progress of a deletion task or None if the task is unknown"""
+        try:
+            task = self.es_client.tasks.get(task_id=task_id)
+        except elasticsearch.NotFoundError:
+            return None
+        status = task.get("response") or task["task"].get("status", {})
+        return {
+            "task": task_id,
+            "completed": task.get("completed", False),
+            "total": status.get("total", 0),
+            "deleted": status.get("deleted", 0),
+            "failures": status.get("failures", []),
+            "error": task.get("error"),
+        }
+
+    def delete_project_logs(self, project, query, logs_request):
+        """Deletes logs of a project matching a query. Deletes of the shared index complete before
+        the promotion of the project is checked, then the dedicated index it is being promoted to
+        is cleared too, so the promotion can't bring the deleted logs back"""
+        es_index_name, routing = self.get_log_target(project)
         if not self.index_exists(es_index_name):
             return 0
-        bodies = []
-        for res in elasticsearch.helpers.scan(self.es_client,
-                                              query=self.get_ids_query(logs_request["ids"]),
-                                              index=es_index_name):
-            bodies.append({
-                "_op_type": "delete",
-                "_id": res["_id"],
-                "_index": res["_index"],
-            })
-        return self._bulk_index(bodies)
+        if routing is None:
+            return self.delete_logs_by_query(es_index_name, query, logs_request)
+        logs_request = dict(logs_request, wait_for_completion=True)
+        deleted = self.delete_logs_by_query(es_index_name, query, logs_request, routing=routing)
+        promotion_index = self.get_promotion_index(project)
+        if promotion_index is not None:
+            deleted += self.delete_logs_by_query(promotion_index, query, logs_request)
+        return deleted
+
+    def delete_logs(self, logs_request):
+        return self.delete_project_logs(
+            logs_request["project"], self.get_ids_query(logs_request["ids"])["query"], logs_request)
 
     def delete_logs_by_date(self, logs_request):
-        es_index_name = self.get_index_name(logs_request["project"])
         start_date = logs_request["start_date"]
         end_date = logs_request["end_date"]
-        if not self.index_exists(es_index_name):
-            return 0
         query = {
             "range": {
                 "log_time": {"gte": start_date, "lte": end_date, "format": "yyyy-MM-dd"}
             }
         }
-        delete_response = self.delete_by_query(query, es_index_name)
-        self.log_response(
-            delete_response,
-            success_message=f"Deleted logs in range {start_date, end_date} from {es_index_name}",
-            error_message=f"Unable to delete logs in range {start_date, end_date} from {es_index_name}",
-        )
-        return delete_response["deleted"] if "deleted" in delete_response else 0
+        return self.delete_project_logs(logs_request["project"], query, logs_request)
 
-    def search_logs(self, search_query):
-        return self.get_logs_by_query(search_query["project"], {
+    def get_search_query(self, query):
+        return {
             "size": 100,
             "query": {
                 "match": {
-                    "log_message": search_query["query"]
+                    "log_message": query
                 }
             }
-        }, max_num=100)
+        }
+
+    def search_logs(self, search_query):
+        query, limit = self.get_read_query("search_logs", search_query)
+        return self.get_logs_by_query(search_query["project"], query, max_num=limit,
+                                      log_options=self.get_log_options(search_query))
+
+    def get_read_query(self, operation, read_request):
+        """Returns the query and the number of logs to return of a read operation"""
+        if operation == "get_logs_by_ids":
+            query, default_limit = self.get_ids_query(read_request["ids"]), 1000
+        elif operation == "get_logs_by_test_item":
+            query, default_limit = self.get_test_item_query(read_request["test_item"]), 1000
+        elif operation == "search_logs":
+            query, default_limit = self.get_search_query(read_request["query"]), 100
+        elif operation == "search_logs_by_pattern":
+            query, default_limit = self.get_pattern_query(
+                read_request["query"], self.get_pattern_field(read_request["project"])), 100
+        else:
+            raise ValueError(f"Unsupported operation '{operation}'")
+        fields = get_requested_fields(read_request)
+        if fields is not None:
+            source_fields = [field for field in fields if field != "id"]
+            # an empty list would return the whole source
+            query = dict(query, _source=source_fields or False)
+        if operation == "search_logs" and read_request.get("highlight"):
+            query = dict(query, highlight=SEARCH_HIGHLIGHT)
+        return query, utils.get_read_limit(read_request, default_limit, max_limit=MAX_RESULT_WINDOW)
+
+    def read_logs_page(self, operation, read_request):
+        """Returns a page of a read operation and the cursor of the next one"""
+        query, limit = self.get_read_query(operation, read_request)
+        return self.get_logs_page(read_request["project"], query, limit, cursor=read_request.get("cursor"),
+                                  log_options=self.get_log_options(read_request))
+
+    def batch_read(self, read_requests):
+        """Runs read requests in a single _msearch round trip, results are keyed by request id"""
+        results = {}
+        request_ids = []
+        request_log_options = []
+        body = []
+        for read_request in read_requests:
+            request_id = read_request["id"]
+            try:
+                query, max_num = self.get_read_query(read_request["operation"], read_request["body"])
+                log_options = self.get_log_options(read_request["body"])
+                es_index_name, routing = self.get_log_target(read_request["body"]["project"])
+            except (KeyError, ValueError) as err:
+                results[request_id] = {"error": str(err)}
+                continue
+            if not self.index_exists(es_index_name, print_error=False):
+                results[request_id] = []
+                continue
+            header = {"index": es_index_name}
+            if routing is not None:
+                header["routing"] = routing
+            preference = self.get_read_preference(read_request["body"]["project"])
+            if preference:
+                header["preference"] = preference
+            body.extend([header, dict(self.filter_by_project(query, routing), size=max_num)])
+            request_ids.append(request_id)
+            request_log_options.append(log_options)
+        if not request_ids:
+            return results
+        start_time = time()
+        with STAGE_LATENCY.labels("db").time():
+            responses = self.es_client.msearch(body=body)["responses"]
+        with STAGE_LATENCY.labels("objects").time():
+            for request_id, log_options, response in zip(request_ids, request_log_options, responses):
+                if "error" in response:
+                    error = response["error"]
+                    if isinstance(error, dict):
+                        error = error.get("reason", error)
+                    results[request_id] = {"error": error}
+                else:
+                    results[request_id] = [self.transform_hit_to_log(hit, **log_options)
+                                           for hit in response["hits"]["hits"]]
+        logger.info("Finished batch of %d searches for %.2f s", len(request_ids), time() - start_time)
+        return results
 
     def get_regexp_query(self, field, query, case_insensitive=False):
         return {
@@ -263,19 +670,66 @@ class EsClient:
             }
         }
 
+    def get_pattern_query(self, query, field="log_message.no_tokenization"):
+        return {"size": 100, "query": self.get_regexp_query(field, query)}
+
+    def get_pattern_field(self, project):
+        _, routing = self.get_log_target(project)
+        options = self.get_template_options(None if routing is not None else project)
+        return PATTERN_FIELDS[options["pattern_field"]][1]
+
     def search_logs_by_pattern(self, search_query):
-        query = self.get_regexp_query("log_message.no_tokenization", search_query["query"])
-        return self.get_logs_by_query(
-            search_query["project"], {"size": 100, "query": query}, max_num=100
-        )
+        query, limit = self.get_read_query("search_logs_by_pattern", search_query)
+        return self.get_logs_by_query(search_query["project"], query, max_num=limit,
+                                      log_options=self.get_log_options(search_query))
 
-    def initialize_ilm(self, project_id):
-        index_name = self.get_index_name(project_id)
+    def initialize_ilm(self, index_name, template=None):
         policy_name = self.get_policy_name(index_name)
         template_name = self.get_template_name(index_name)
+        self.invalidate_index_cache(index_name)
         self.initialize_policy(policy_name)
-        self.initialize_template(index_name, policy_name, template_name)
+        self.initialize_template(index_name, policy_name, template_name, template=template)
         self.initialize_index(index_name)
+        self.cache_index(index_name)
+
+    def get_template_options(self, project=None):
+        """Returns the index settings of a project: deployment defaults with the project overrides"""
+        options = {
+            "number_of_shards": self.app_config.get("esNumberOfShards", 1),
+            "number_of_replicas": self.app_config.get("esNumberOfReplicas", 0),
+            "refresh_interval": self.app_config.get("esRefreshInterval", ""),
+            "codec": self.app_config.get("esIndexCodec", "default"),
+            "pattern_field": self.app_config.get("esPatternField", "keyword"),
+        }
+        if project is not None:
+            overrides = self.app_config.get("esProjectTemplateSettings", {}).get(str(project), {})
+            options.update({key: value for key, value in overrides.items() if key in TEMPLATE_OPTIONS})
+        if options["pattern_field"] not in PATTERN_FIELDS:
+            raise ValueError(f"Unknown pattern field '{options['pattern_field']}', "
+                             f"expected one of {', '.join(PATTERN_FIELDS)}")
+        return options
+
+    def get_index_template(self, project=None):
+        """Builds the index template of a project from BASIC_TEMPLATE and the template options"""
+        options = self.get_template_options(project)
+        template = copy.deepcopy(BASIC_TEMPLATE)
+        template["settings"]["number_of_shards"] = int(options["number_of_shards"])
+        template["settings"]["number_of_replicas"] = int(options["number_of_replicas"])
+        if options["refresh_interval"]:
+            template["settings"]["refresh_interval"] = options["refresh_interval"]
+        if options["codec"] and options["codec"] != "default":
+            template["settings"]["codec"] = options["codec"]
+        pattern_fields = PATTERN_FIELDS[options["pattern_field"]][0]
+        if pattern_fields:
+            template["mappings"]["properties"]["log_message"]["fields"] = copy.deepcopy(pattern_fields)
+        return template
+
+    def get_shared_template(self):
+        """Template of the shared index, its logs carry their project and must be routed"""
+        template = self.get_index_template()
+        template["mappings"]["_routing"] = {"required": True}
+        template["mappings"]["properties"]["project"] = {"type": "keyword"}
+        return template
 
     def initialize_index(self, index_name):
         add_initial_index_response = self.put_initial_index(index_name)
@@ -285,8 +739,8 @@ class EsClient:
         if add_initial_index_response["status_code"] != 200:
             raise RuntimeError
 
-    def initialize_template(self, index_name, policy_name, template_name):
-        template = BASIC_TEMPLATE
+    def initialize_template(self, index_name, policy_name, template_name, template=None):
+        template = copy.deepcopy(template or self.get_index_template())
         template["settings"]["index.lifecycle.name"] = policy_name
         template["settings"]["index.lifecycle.rollover_alias"] = index_name
         template = {
@@ -308,80 +762,94 @@ class EsClient:
         if add_policy_response["status_code"] != 200:
             raise RuntimeError
 
+    def ensure_log_index(self, index_name, project_id, routing):
+        """Creates the ILM index of a log target unless it exists, returns whether it can be written"""
+        if self.index_exists(index_name, print_error=False):
+            return True
+        logger.warning(f"The index {index_name} for project {project_id} "
+                       "does not exist, creating a new one")
+        try:
+            self.initialize_ilm(index_name, template=self.get_index_template(project_id)
+                                if routing is None else self.get_shared_template())
+            logger.info(f"Initialized index {index_name} with ILM")
+            return True
+        except RuntimeError:
+            # another process may have just created it
+            if self.index_exists(index_name, print_error=False):
+                return True
+            logger.error(f"Error while initializing the index {index_name} for project {project_id}")
+            return False
+
     def index_logs(self, index_query):
         logs = index_query["logs"]
         project_id = index_query["project"]
-        index_name = self.get_index_name(project_id)
-        if not self.es_client.indices.exists(index_name):
-            logger.warning(f"The index {index_name} for project {project_id} "
-                           "does not exist, creating a new one")
-            try:
-                self.initialize_ilm(project_id)
-                logger.info(f"Initialized index {index_name} with ILM")
-            except RuntimeError:
-                logger.error(f"Error while initializing the index {index_name} for project {project_id}")
-                return 0
-        prepared_logs = []
-        for log in logs:
-            if "id" in log:
-                prepared_logs.append({
-                    "_id": log["id"],
-                    "_index": index_name,
-                    "_source": log
-                })
-            else:
-                prepared_logs.append({
-                    "_index": index_name,
-                    "_source": log
-                })
-        return self._bulk_index(prepared_logs)
+        require_alias = self.app_config.get("esBulkRequireAlias", True)
+        success_count = 0
+        errors = []
+        # the cached existence of the alias is stale if another process deleted the project,
+        # the bulk requires the alias then, so that the logs missing it are written once more
+        # after the index is created with its template instead of into an auto-created index
+        for attempt in range(2):
+            index_name, routing = self.get_log_target(project_id)
+            if not self.ensure_log_index(index_name, project_id, routing):
+                break
+            prepared_logs = []
+            for log in logs:
+                prepared_log = {"_index": index_name, "_source": log}
+                if "id" in log:
+                    prepared_log["_id"] = log["id"]
+                if routing is not None:
+                    # the same id is written again if the project is being promoted
+                    prepared_log["_id"] = log.get("id", uuid.uuid4().hex)
+                    prepared_log["_routing"] = routing
+                    prepared_log["_source"] = dict(log, project=routing)
+                prepared_logs.append(prepared_log)
+            missing = [] if require_alias and attempt == 0 else None
+            indexed, bulk_errors = self._bulk_index(prepared_logs, refresh=index_query.get("refresh"),
+                                                    require_alias=require_alias, missing=missing)
+            success_count += indexed
+            errors.extend(bulk_errors)
+            if routing is not None and indexed:
+                self.write_to_promotion_index(project_id, prepared_logs, refresh=index_query.get("refresh"))
+                self.maybe_promote_project(project_id)
+            if not missing:
+                break
+            logger.warning("The index %s for project %s was deleted, writing %d logs again",
+                           index_name, project_id, len(missing))
+            self.invalidate_index_cache(index_name)
+            logs = [logs[position] for position in missing]
+        if index_query.get("report_errors"):
+            return {"indexed": success_count, "errors": errors}
+        return success_count
 
     def get_policy(self, policy_name):
-        get_policy_response = requests.get(
-            "%s/_ilm/policy/%s" % (self.host, policy_name),
-            headers={"Content-type": "application/json", "Accept": "text/plain"}
-        ).__dict__
+        get_policy_response = self.perform_request("GET", f"/_ilm/policy/{policy_name}")
         if get_policy_response["status_code"] == 404:
             raise elasticsearch.NotFoundError
-        return list(json.loads(get_policy_response["_content"]).values())[0]["policy"]
-
-    def delete_by_query(self, query, index_name):
-        return requests.post(
-            "%s/%s/_delete_by_query" % (self.host, index_name),
-            data=json.dumps({"query": query}),
-            headers={"Content-type": "application/json", "Accept": "text/plain"}
-        ).__dict__
+        return list(get_policy_response["body"].values())[0]["policy"]
 
     def put_policy(self, policy_name, policy_dict):
-        return requests.put(
-            "%s/_ilm/policy/%s" % (self.host, policy_name),
-            data=json.dumps({"policy": policy_dict}),
-            headers={"Content-type": "application/json", "Accept": "text/plain"}
-        ).__dict__
+        return self.perform_request("PUT", f"/_ilm/policy/{policy_name}", body={"policy": policy_dict})
 
     def put_template(self, template_name, template_dict):
-        return requests.put(
-            "%s/_index_template/%s" % (self.host, template_name),
-            data=json.dumps(template_dict),
-            headers={"Content-type": "application/json", "Accept": "text/plain"}
-        ).__dict__
+        return self.perform_request("PUT", f"/_index_template/{template_name}", body=template_dict)
 
     def put_initial_index(self, index_name):
-        return requests.put(
-            "%s/%s-000001" % (self.host, index_name),
-            data=json.dumps({"aliases": {index_name: {"is_write_index": True}}}),
-            headers={"Content-type": "application/json", "Accept": "text/plain"},
-        ).__dict__
+        return self.perform_request(
+            "PUT", f"/{index_name}-000001", body={"aliases": {index_name: {"is_write_index": True}}})
 
     def update_policy_keep_logs_days(self, update_query):
         project_id = update_query["project"]
         new_keep_logs_days_value = update_query["keep_logs_days"]
         policy_name = self.get_policy_name(self.get_index_name(project_id))
+        _, routing = self.get_log_target(project_id)
         try:
             policy = self.get_policy(policy_name)
         except elasticsearch.NotFoundError:
-            logger.error("The policy %s not found" % policy_name)
-            return 0
+            if routing is None:
+                logger.error("The policy %s not found" % policy_name)
+                return 0
+            policy = copy.deepcopy(BASIC_POLICY)
         if "delete" in policy["phases"]:
             policy["phases"]["delete"]["min_age"] = f"{new_keep_logs_days_value}d"
         else:
@@ -393,4 +861,221 @@ class EsClient:
         self.log_response(put_policy_response,
                           success_message=f"The policy {policy_name} was updated.",
                           error_message=f"Error while updating the policy {policy_name}")
+        if routing is not None and put_policy_response["status_code"] == 200:
+            # retention is a policy of a dedicated index, so the project gets its own index
+            self.start_promotion(project_id)
         return int(put_policy_response["status_code"] == 200)
+
+    def write_to_promotion_index(self, project, prepared_logs, refresh=None):
+        """Writes logs just written to the shared index to the dedicated index of the project,
+        if it is being promoted, the copy of the promotion may have missed them"""
+        try:
+            promotion_index = self.get_promotion_index(project)
+        except Exception as err:
+            logger.error("Unable to check promotion of project %s", project)
+            logger.error(err)
+            return
+        if promotion_index is None:
+            return
+        self._bulk_index([{"_index": promotion_index, "_id": prepared_log["_id"],
+                           "_source": {key: value for key, value in prepared_log["_source"].items()
+                                       if key != "project"}}
+                          for prepared_log in prepared_logs], refresh=refresh)
+
+    def maybe_promote_project(self, project):
+        """Promotes a project of the shared index to a dedicated index once it has enough logs,
+        the logs of a project are counted at most once per promotion check interval"""
+        now = time()
+        with self.promotion_lock:
+            if self.promotion_checks.get(str(project), 0) > now:
+                return
+            self.promotion_checks[str(project)] = now + self.app_config.get("esPromotionCheckInterval", 300)
+        try:
+            count = self.es_client.count(
+                index=self.get_shared_index_name(), routing=str(project),
+                body={"query": {"term": {"project": str(project)}}})["count"]
+        except Exception as err:
+            logger.error("Unable to count logs of project %s in the shared index", project)
+            logger.error(err)
+            return
+        if count >= self.app_config.get("esPromotionDocs", 1000000):
+            logger.info("Project %s has %d logs in the shared index, promoting it", project, count)
+            self.start_promotion(project)
+
+    def start_promotion(self, project):
+        with self.promotion_lock:
+            if str(project) in self.promoting_projects:
+                return
+            self.promoting_projects.add(str(project))
+        threading.Thread(target=self.promote_project, args=(project,), daemon=True).start()
+
+    def get_promotion_index(self, project):
+        """Returns the dedicated index a project of the shared index is being or was promoted to.
+        It isn't cached: writes and deletes of the shared index must reach it as soon as it exists"""
+        index_name = self.get_index_name(project)
+        for es_index_name in [index_name, f"{index_name}-000001"]:
+            if self.es_client.indices.exists(index=es_index_name):
+                return es_index_name
+        return None
+
+    def copy_project_logs(self, project, dest_index, batch_size=1000):
+        """Copies the logs of a project from the shared index, without their project and routing.
+        Copies of logs deleted from the shared index meanwhile are removed again, unless ingest has
+        rewritten them since, so deleted logs don't come back in the dedicated index"""
+        shared_index_name = self.get_shared_index_name()
+        routing = str(project)
+        self.es_client.indices.refresh(index=shared_index_name)
+        hits = self.scroll_hits(shared_index_name, {"query": {"term": {"project": routing}}}, routing=routing)
+        copied = 0
+        while True:
+            batch = list(islice(hits, batch_size))
+            if not batch:
+                return copied
+            created = {}
+            for ok, item in elasticsearch.helpers.streaming_bulk(self.es_client, [{
+                    "_op_type": "create", "_index": dest_index, "_id": hit["_id"],
+                    "_source": {key: value for key, value in hit["_source"].items() if key != "project"}}
+                    for hit in batch], raise_on_error=False):
+                result = item["create"]
+                if ok:
+                    created[result["_id"]] = (result["_seq_no"], result["_primary_term"])
+                elif result.get("status") != 409:
+                    raise RuntimeError(f"Error while copying log {result.get('_id')}: {result.get('error')}")
+            if not created:
+                continue
+            docs = self.es_client.mget(index=shared_index_name, body={"ids": list(created)},
+                                       routing=routing, _source=False)["docs"]
+            deleted_ids = [doc["_id"] for doc in docs if not doc.get("found")]
+            if deleted_ids:
+                # bulk helpers drop the conditions, so the request is built here
+                self.es_client.bulk(body=[{"delete": {
+                    "_index": dest_index, "_id": log_id,
+                    "if_seq_no": created[log_id][0], "if_primary_term": created[log_id][1]}}
+                    for log_id in deleted_ids])
+            copied += len(created) - len(deleted_ids)
+
+    def promote_project(self, project):
+        """Moves the logs of a project from the shared index to a dedicated one. Once the dedicated
+        index is created, writes and deletes of the project in the shared index reach it too, so
+        after the copy every log left in the shared index is also in the dedicated one. The alias
+        makes the dedicated index visible, the shared index logs are deleted once readers that
+        cached the shared index as the target of the project have switched"""
+        index_name = self.get_index_name(project)
+        policy_name = self.get_policy_name(index_name)
+        first_index_name = f"{index_name}-000001"
+        start_time = time()
+        created = visible = False
+        try:
+            try:
+                self.get_policy(policy_name)
+            except elasticsearch.NotFoundError:
+                self.initialize_policy(policy_name)
+            self.initialize_template(index_name, policy_name, self.get_template_name(index_name),
+                                     template=self.get_index_template(project))
+            create_response = self.perform_request("PUT", f"/{first_index_name}")
+            if create_response["status_code"] != 200:
+                self.log_response(create_response, success_message="",
+                                  error_message=f"Project {project} is already being promoted")
+                return 0
+            created = True
+            copied = self.copy_project_logs(project, first_index_name)
+            alias_response = self.perform_request("POST", "/_aliases", body={"actions": [{"add": {
+                "index": first_index_name, "alias": index_name, "is_write_index": True}}]})
+            self.log_response(alias_response, success_message=f"Index {index_name} is visible",
+                              error_message=f"Error while adding the alias {index_name}")
+            if alias_response["status_code"] != 200:
+                raise RuntimeError
+            visible = True
+            self.cache_index(index_name)
+            with self.known_indices_lock:
+                self.shared_projects.pop(str(project), None)
+            sleep(self.index_cache_ttl)
+            self.delete_logs_by_query(self.get_shared_index_name(), {"match_all": {}},
+                                      {"wait_for_completion": True}, routing=str(project))
+            logger.info("Promoted project %s with %d logs for %.2f s", project, copied, time() - start_time)
+            return 1
+        except Exception as err:
+            logger.error("Error while promoting project %s to a dedicated index", project)
+            logger.error(err)
+            if created and not visible:
+                self.discard_promotion_index(project, first_index_name)
+            return 0
+        finally:
+            with self.promotion_lock:
+                self.promoting_projects.discard(str(project))
+
+    def discard_promotion_index(self, project, es_index_name):
+        """Deletes the dedicated index of a failed promotion, so writes stop reaching it and the project
+        can be promoted again. A write that found the index just before may create it again,
+        so it's deleted once more after such writes have timed out, unless a later promotion
+        has made it visible meanwhile"""
+        for attempt in range(2):
+            if attempt:
+                sleep(BULK_REQUEST_TIMEOUT)
+            try:
+                if es_index_name in self.get_alias_indices(self.get_index_name(project)):
+                    return
+                self.es_client.indices.delete(index=es_index_name, ignore_unavailable=True)
+            except Exception as err:
+                logger.error("Unable to delete the index %s of the failed promotion of project %s",
+                             es_index_name, project)
+                logger.error(err)
+                return
+        logger.info("Deleted the index %s of the failed promotion of project %s", es_index_name, project)
+
+    def get_alias_indices(self, alias):
+        try:
+            return sorted(self.es_client.indices.get_alias(name=alias))
+        except elasticsearch.NotFoundError:
+            return []
+
+    def reindex_alias(self, alias, template, query=None):
+        """Migrates the indices behind an alias to a new index built with the current template.
+        The new index is filled before the alias is switched to it, logs still written to the old
+        indices are copied once more after the switch, then the old indices are deleted"""
+        old_indices = self.get_alias_indices(alias)
+        if not old_indices:
+            return {"indices": [], "index": None, "copied": 0}
+        start_time = time()
+        self.initialize_template(alias, self.get_policy_name(alias), self.get_template_name(alias),
+                                 template=template)
+        last_number = max((int(index_name.rsplit("-", 1)[-1]) for index_name in old_indices
+                           if index_name.rsplit("-", 1)[-1].isdigit()), default=0)
+        new_index = f"{alias}-{last_number + 1:06d}"
+        create_response = self.perform_request("PUT", f"/{new_index}")
+        self.log_response(create_response, success_message=f"The index {new_index} was added.",
+                          error_message=f"Error while adding the index {new_index}")
+        if create_response["status_code"] != 200:
+            raise RuntimeError
+        copied = 0
+        for op_type in ["index", "create"]:
+            response = self.es_client.reindex(
+                body={"conflicts": "proceed",
+                      "source": {"index": ",".join(old_indices), "query": query or {"match_all": {}}},
+                      "dest": {"index": new_index, "op_type": op_type}},
+                refresh=True, wait_for_completion=True,
+                request_timeout=self.app_config.get("esReindexTimeout", 3600))
+            if response.get("failures"):
+                raise RuntimeError(f"Failures while reindexing {alias}: {response['failures']}")
+            copied += response.get("created", 0) + response.get("updated", 0)
+            if op_type == "index":
+                actions = [{"remove": {"index": index_name, "alias": alias}} for index_name in old_indices]
+                actions.append({"add": {"index": new_index, "alias": alias, "is_write_index": True}})
+                alias_response = self.perform_request("POST", "/_aliases", body={"actions": actions})
+                self.log_response(alias_response,
+                                  success_message=f"The alias {alias} points to {new_index}",
+                                  error_message=f"Error while switching the alias {alias}")
+                if alias_response["status_code"] != 200:
+                    raise RuntimeError
+        self.es_client.indices.delete(index=",".join(old_indices))
+        self.cache_index(alias)
+        logger.info("Reindexed %d logs of %s into %s for %.2f s",
+                    copied, alias, new_index, time() - start_time)
+        return {"indices": old_indices, "index": new_index, "copied": copied}
+
+    def reindex_project(self, project):
+        """Migrates the dedicated indices of a project to its current template options"""
+        return self.reindex_alias(self.get_index_name(project), self.get_index_template(project))
+
+    def reindex_shared_index(self):
+        return self.reindex_alias(self.get_shared_index_name(), self.get_shared_template())
@@ -0,0 +1,76 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import threading
+from elasticsearch import Urllib3HttpConnection
+from elasticsearch.connection_pool import ConnectionSelector, RandomSelector, RoundRobinSelector
+
+
+class InFlightConnection(Urllib3HttpConnection):
+    """Connection counting the requests it is currently serving"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.requests = 0
+        self.in_flight_lock = threading.Lock()
+
+    def perform_request(self, *args, **kwargs):
+        with self.in_flight_lock:
+            self.in_flight += 1
+            self.requests += 1
+        try:
+            return super().perform_request(*args, **kwargs)
+        finally:
+            with self.in_flight_lock:
+                self.in_flight -= 1
+
+
+class LeastLoadedSelector(ConnectionSelector):
+    """Picks the live connection with the fewest requests in flight, ties go round-robin"""
+    def __init__(self, opts):
+        super().__init__(opts)
+        self.counter = 0
+
+    def select(self, connections):
+        self.counter += 1
+        offset = self.counter % len(connections)
+        rotated = connections[offset:] + connections[:offset]
+        return min(rotated, key=lambda connection: getattr(connection, "in_flight", 0))
+
+
+SELECTORS = {
+    "round_robin": RoundRobinSelector,
+    "random": RandomSelector,
+    "least_loaded": LeastLoadedSelector,
+}
+
+
+def get_selector_class(name):
+    if name not in SELECTORS:
+        raise ValueError(f"Unknown Elasticsearch node selector '{name}', "
+                         f"expected one of {', '.join(SELECTORS)}")
+    return SELECTORS[name]
+
+
+def get_node_metrics(connection_pool):
+    """Returns live and dead node counts and the requests served by each node"""
+    connections = getattr(connection_pool, "orig_connections", None) or [connection_pool.connection]
+    live_connections = getattr(connection_pool, "connections", connections)
+    metrics = {"nodes": len(connections), "live_nodes": len(live_connections),
+               "dead_nodes": len(connections) - len(live_connections)}
+    for idx, connection in enumerate(connections):
+        metrics[f"node_{idx}_in_flight"] = getattr(connection, "in_flight", 0)
+        metrics[f"node_{idx}_requests"] = getattr(connection, "requests", 0)
+    return metrics
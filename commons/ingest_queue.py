@@ -0,0 +1,184 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import logging
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from pydantic import ValidationError
+from time import time
+from commons.launch_objects import Log
+
+logger = logging.getLogger("esLogsService.ingestQueue")
+
+
+class IngestQueueFullError(Exception):
+    """Raised when the ingest queue can't accept more batches"""
+
+
+def validate_index_query(index_query):
+    """Returns an error message for a malformed index_logs payload or None"""
+    if not isinstance(index_query, dict) or "project" not in index_query:
+        return "The 'project' field is required"
+    logs = index_query.get("logs")
+    if not isinstance(logs, list):
+        return "The 'logs' field should be a list"
+    for idx, log in enumerate(logs):
+        if not isinstance(log, dict):
+            return f"Log #{idx} should be an object"
+        try:
+            Log(**log)
+        except ValidationError as err:
+            return f"Log #{idx} is invalid: {err}"
+    return None
+
+
+class IngestQueue:
+    """Bounded in-process queue, a background writer coalesces batches per project"""
+    def __init__(self, index_logs, max_size=100, max_batch_size=10000,
+                 linger_time=0.5, max_statuses=10000):
+        self.index_logs = index_logs
+        self.queue = queue.Queue(maxsize=max_size)
+        self.max_batch_size = max_batch_size
+        self.linger_time = linger_time
+        self.max_statuses = max_statuses
+        self.statuses = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "written_batches": 0,
+            "written_logs": 0,
+            "failed_logs": 0,
+        }
+        self.stopped = threading.Event()
+        self.writer = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self.writer.start()
+
+    def _set_status(self, token, status):
+        with self.lock:
+            self.statuses[token] = status
+            self.statuses.move_to_end(token)
+            while len(self.statuses) > self.max_statuses:
+                self.statuses.popitem(last=False)
+
+    def submit(self, index_query):
+        """Enqueues an index_logs payload and returns its ack token"""
+        if self.stopped.is_set():
+            raise IngestQueueFullError("The ingest queue is shutting down")
+        token = uuid.uuid4().hex
+        self._set_status(token, {"status": "queued", "logs": len(index_query["logs"])})
+        try:
+            self.queue.put_nowait((token, index_query))
+        except queue.Full:
+            with self.lock:
+                self.statuses.pop(token, None)
+                self.stats["rejected"] += 1
+            raise IngestQueueFullError("The ingest queue is full")
+        with self.lock:
+            self.stats["accepted"] += 1
+        return token
+
+    def get_status(self, token=None):
+        with self.lock:
+            if token is not None:
+                return self.statuses.get(token)
+            stats = dict(self.stats)
+        stats["queued"] = self.queue.qsize()
+        stats["max_queued"] = self.queue.maxsize
+        return stats
+
+    def _add_pending(self, pending, item):
+        token, index_query = item
+        logs = index_query["logs"]
+        # rows with and without explicit ids can't share one bulk for Postgres,
+        # batches are written with the refresh policy of their requests and
+        # a request reporting errors is written alone to get its own errors
+        report_errors = bool(index_query.get("report_errors"))
+        key = (index_query["project"], bool(logs) and "id" in logs[0],
+               index_query.get("refresh"), report_errors and token)
+        pending.setdefault(key, []).append((token, logs))
+        return len(logs)
+
+    def _write(self, project, items, refresh=None, report_errors=False):
+        logs = [log for _, batch in items for log in batch]
+        index_query = {"project": project, "logs": logs}
+        if refresh is not None:
+            index_query["refresh"] = refresh
+        if report_errors:
+            index_query["report_errors"] = True
+        start_time = time()
+        errors = None
+        try:
+            indexed = self.index_logs(index_query)
+            if isinstance(indexed, dict):
+                errors = indexed.get("errors")
+                indexed = indexed["indexed"]
+        except Exception as err:
+            logger.error("Error while writing queued logs for project %s", project)
+            logger.error(err)
+            indexed = 0
+            if report_errors:
+                errors = [{"error": str(err)}]
+        if indexed >= len(logs):
+            status = "done"
+        elif indexed > 0:
+            status = "partial"
+        else:
+            status = "failed"
+        for token, batch in items:
+            token_status = {"status": status, "logs": len(batch),
+                            "batch_logs": len(logs), "batch_indexed": indexed}
+            if report_errors:
+                token_status["errors"] = errors or []
+            self._set_status(token, token_status)
+        with self.lock:
+            self.stats["written_batches"] += 1
+            self.stats["written_logs"] += indexed
+            self.stats["failed_logs"] += len(logs) - indexed
+        logger.debug("Wrote %d queued logs of %d requests for project %s in %.2f s",
+                     indexed, len(items), project, time() - start_time)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped.is_set():
+                    return
+                continue
+            pending = {}
+            pending_count = self._add_pending(pending, item)
+            deadline = time() + self.linger_time
+            while pending_count < self.max_batch_size:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending_count += self._add_pending(pending, item)
+            for (project, _, refresh, report_errors), items in pending.items():
+                self._write(project, items, refresh=refresh, report_errors=bool(report_errors))
+
+    def stop(self, timeout=None):
+        """Stops accepting batches and waits until the queued ones are written"""
+        self.stopped.set()
+        self.writer.join(timeout)
+        if self.writer.is_alive():
+            logger.error("Ingest queue wasn't flushed in time, %d requests are left",
+                         self.queue.qsize())
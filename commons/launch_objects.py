@@ -14,11 +14,41 @@
 * limitations under the License.
 """
 
+import orjson
 from pydantic import BaseModel
 
+LOG_FIELDS = ["id", "uuid", "log_time", "log_message", "item_id",
+              "launch_id", "last_modified", "log_level", "attachment_id"]
+
+
+def get_requested_fields(read_request):
+    """Returns the log fields a read request asks for in LOG_FIELDS order, None for all fields"""
+    fields = read_request.get("fields")
+    if fields is None:
+        return None
+    if not isinstance(fields, list) or not fields or not set(fields) <= set(LOG_FIELDS):
+        raise ValueError(f"Fields should be a non-empty list of {', '.join(LOG_FIELDS)}")
+    if len(set(fields)) == len(LOG_FIELDS):
+        return None
+    return [field for field in LOG_FIELDS if field in fields]
+
+
+def get_max_message_chars(read_request):
+    """Returns the length log messages of a read request are truncated to, None for whole messages"""
+    max_message_chars = read_request.get("max_message_chars")
+    if max_message_chars is None:
+        return None
+    try:
+        max_message_chars = int(max_message_chars)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid max_message_chars '{max_message_chars}'")
+    if max_message_chars < 0:
+        raise ValueError("The max_message_chars should not be negative")
+    return max_message_chars
+
 
 class Log(BaseModel):
-    """Log object"""
+    """Log object, validates logs at the ingest boundary"""
     id: str = ""
     uuid: str
     log_time: str
@@ -28,3 +58,43 @@ class Log(BaseModel):
     last_modified: str
     log_level: int
     attachment_id: int = None
+
+
+class LogRow:
+    """Log read from the database, trusted output is taken as is without validation.
+    When fields are set, only these fields are serialized, highlight fragments are
+    serialized when they were requested"""
+    __slots__ = LOG_FIELDS + ["fields", "highlight"]
+
+    def __init__(self, id="", uuid=None, log_time=None, log_message=None, item_id=None,
+                 launch_id=None, last_modified=None, log_level=None, attachment_id=None,
+                 fields=None, highlight=None):
+        self.id = id
+        self.uuid = uuid
+        self.log_time = log_time
+        self.log_message = log_message
+        self.item_id = item_id
+        self.launch_id = launch_id
+        self.last_modified = last_modified
+        self.log_level = log_level
+        self.attachment_id = attachment_id
+        self.fields = fields
+        self.highlight = highlight
+
+    @classmethod
+    def from_tuple(cls, values):
+        """Builds a log from values ordered as LOG_FIELDS"""
+        return cls(*values)
+
+    @classmethod
+    def from_dict(cls, obj, fields=None):
+        return cls(*map(obj.get, LOG_FIELDS), fields=fields)
+
+    def dict(self):
+        log = {field: getattr(self, field) for field in self.fields or LOG_FIELDS}
+        if self.highlight is not None:
+            log["highlight"] = self.highlight
+        return log
+
+    def json(self):
+        return orjson.dumps(self.dict()).decode("utf-8")
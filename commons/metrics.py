@@ -0,0 +1,93 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import os
+import shutil
+import tempfile
+
+MULTIPROC_DIR_ENV = "prometheus_multiproc_dir"
+
+
+def setup_multiprocess_dir():
+    """prometheus_client picks its value store on import, so with several web workers the directory
+    the workers share is set before the import, it's created empty by the process forking them"""
+    if MULTIPROC_DIR_ENV in os.environ or int(os.getenv("WEB_WORKERS", 1)) <= 1:
+        return
+    directory = os.path.join(tempfile.gettempdir(), f"es_logs_metrics_{os.getpid()}")
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    os.environ[MULTIPROC_DIR_ENV] = directory
+
+
+setup_multiprocess_dir()
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,  # noqa: E402,F401
+                               REGISTRY, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram("es_logs_request_latency_seconds", "Latency of HTTP requests by route",
+                            ["route", "method"], buckets=LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram("es_logs_stage_latency_seconds",
+                          "Latency of request stages: decode, db, objects, serialization",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+HTTP_BYTES = Counter("es_logs_http_bytes_total", "HTTP body bytes received and sent", ["direction"])
+BULK_ITEMS = Counter("es_logs_bulk_items_total", "Items processed by Elasticsearch bulk requests",
+                     ["result"])
+ROWS_INSERTED = Counter("es_logs_rows_inserted_total", "Rows inserted into PostgreSQL")
+STREAM_ERRORS = Counter("es_logs_stream_errors_total", "Streamed responses cut short by a database error")
+
+
+class StatsCollector:
+    """Exposes a dict of numeric stats returned by get_stats as gauges"""
+    def __init__(self, prefix, description, get_stats):
+        self.prefix = prefix
+        self.description = description
+        self.get_stats = get_stats
+
+    def collect(self):
+        for name, value in self.get_stats().items():
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.description}: {name}", value=value)
+
+
+registered_collectors = {}
+
+
+def register_stats(prefix, description, get_stats):
+    """Registers stats gauges, replacing the ones a forked process inherited from its parent"""
+    if prefix in registered_collectors:
+        REGISTRY.unregister(registered_collectors[prefix])
+    registered_collectors[prefix] = StatsCollector(prefix, description, get_stats)
+    REGISTRY.register(registered_collectors[prefix])
+
+
+def mark_process_dead(pid):
+    """Drops the live values of an exited worker in prometheus multiprocess mode"""
+    if MULTIPROC_DIR_ENV in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def generate_metrics():
+    """Renders metrics of this process or, in prometheus multiprocess mode, of all workers
+    with the stats gauges of the worker answering"""
+    if MULTIPROC_DIR_ENV in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in registered_collectors.values():
+            registry.register(collector)
+        return generate_latest(registry)
+    return generate_latest()
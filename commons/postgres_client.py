@@ -13,14 +13,60 @@
 * See the License for the specific language governing permissions and
 * limitations under the License.
 """
+import hashlib
 import logging
 import psycopg2
-import re
+import psycopg2.errors
+import threading
+from datetime import date, datetime, timedelta
+from itertools import chain, islice
 from commons import launch_objects
+from commons.launch_objects import LOG_FIELDS, get_max_message_chars, get_requested_fields
+from commons.metrics import ROWS_INSERTED, STAGE_LATENCY
+from commons.postgres_migrations import (MESSAGE_TSV_MIGRATION, TEXT_SEARCH_CONFIG, apply_migrations,
+                                         get_pending_migrations)
+from commons.postgres_pool import PostgresConnectionPool
 from time import time
+from utils import utils
 
 logger = logging.getLogger("esLogsService.postgresClient")
 
+HEADLINE_OPTIONS = "MaxFragments=3, MaxWords=25, MinWords=10, StartSel=<em>, StopSel=</em>"
+
+
+class CsvCopyStream:
+    """File-like object encoding rows to CSV lazily while COPY reads it"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ""
+        self.rows_written = 0
+
+    @staticmethod
+    def encode_value(value):
+        if value is None:
+            return ""
+        if isinstance(value, str):
+            return '"' + value.replace('"', '""') + '"'
+        return str(value)
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = ",".join(map(self.encode_value, row)) + "\n"
+            chunks.append(line)
+            length += len(line)
+            self.rows_written += 1
+        data = "".join(chunks)
+        if size < 0 or len(data) <= size:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
 
 class PostgresClient:
     def __init__(self, app_config={}):
@@ -29,6 +75,40 @@ class PostgresClient:
         self.rp_logs_columns = ["uuid", "log_time", "log_message", "item_id",
                                 "launch_id", "project", "last_modified",
                                 "log_level", "attachment_id"]
+        self.log_select_expressions = {
+            "id": "id::text AS id",
+            "uuid": "uuid",
+            "log_time": "to_char(log_time, 'YYYY-MM-DD HH24:MI:SS') AS log_time",
+            "log_message": "log_message",
+            "item_id": "item_id",
+            "launch_id": "launch_id",
+            "last_modified": "to_char(last_modified, 'YYYY-MM-DD HH24:MI:SS') AS last_modified",
+            "log_level": "log_level",
+            "attachment_id": "attachment_id",
+        }
+        self.log_select_columns = ", ".join(self.log_select_expressions[field] for field in LOG_FIELDS)
+        self.row_decoders = {}
+        self.prepared_statements = {}
+        self.ingest_mode = app_config.get("postgresIngestMode", "copy")
+        self.copy_batch_size = app_config.get("postgresCopyBatchSize", 10000)
+        self.cursor_itersize = app_config.get("postgresCursorItersize", 1000)
+        self.rp_logs_retention_name = "rp_logs_retention"
+        self.project_partitions = app_config.get("postgresProjectPartitions", 8)
+        self.partitions_ahead = app_config.get("postgresPartitionsAhead", 2)
+        self.retention_interval = app_config.get("postgresRetentionInterval", 3600)
+        self.truncate_lock_timeout = app_config.get("postgresTruncateLockTimeout", 1000)
+        self.partitioned = False
+        self.known_partitions = set()
+        self.last_retention_time = 0
+        self.retention_lock = threading.Lock()
+        self.schema_initialized = False
+        self.pending_migrations = []
+        self.schema_lock = threading.Lock()
+        self.pool = PostgresConnectionPool(
+            self.connect_to_db,
+            max_size=app_config.get("postgresPoolSize", 10),
+            timeout=app_config.get("postgresPoolTimeout", 30),
+            health_check_interval=app_config.get("postgresPoolHealthCheckInterval", 30))
 
     def connect_to_db(self):
         return psycopg2.connect(user=self.app_config["postgresUser"],
@@ -37,135 +117,232 @@ class PostgresClient:
                                 port=self.app_config["postgresPort"],
                                 database=self.app_config["postgresDatabase"])
 
-    def transform_to_objects(self, query, results):
-        try:
-            transformed_results = []
-            columns = [col.strip() for col in re.search(
-                "select (.*)[\r\n ]+from", query, flags=re.IGNORECASE).group(1).split(",")]
-            for r in results:
-                obj = {}
-                for idx, column in enumerate(columns):
-                    obj[column] = r[idx]
-                transformed_results.append(obj)
-            return transformed_results
-        except Exception as e:
-            logger.error("Didn't derive columns from query")
-            logger.error(e)
-            return results
+    def get_row_decoder(self, columns):
+        """Returns a decoder of rows with the given columns to logs, built once per column set"""
+        columns = tuple(columns)
+        decoder = self.row_decoders.get(columns)
+        if decoder is None:
+            if list(columns) == LOG_FIELDS:
+                decoder = launch_objects.LogRow.from_tuple
+            else:
+                positions = [columns.index(field) if field in columns else None for field in LOG_FIELDS]
+                fields = [field for field in LOG_FIELDS if field in columns]
+                fields = fields if len(fields) < len(LOG_FIELDS) else None
+                highlight_position = columns.index("highlight") if "highlight" in columns else None
 
-    def query_db(self, query, query_all=True, derive_scheme=True, to_commit=False):
-        connection = None
-        final_results = None
-        try:
-            connection = self.connect_to_db()
+                def decoder(row):
+                    return launch_objects.LogRow(
+                        *[None if position is None else row[position] for position in positions],
+                        fields=fields,
+                        highlight=None if highlight_position is None else [row[highlight_position]])
+            self.row_decoders[columns] = decoder
+        return decoder
 
-            cursor = connection.cursor()
-            cursor.execute(query)
-            if to_commit:
-                connection.commit()
+    def get_select_list(self, operation, read_request):
+        """Returns the select list and its parameters of a read operation, messages
+        are truncated and search highlights are built by Postgres"""
+        max_message_chars = get_max_message_chars(read_request)
+        expressions = []
+        params = []
+        for field in get_requested_fields(read_request) or LOG_FIELDS:
+            if field == "log_message" and max_message_chars is not None:
+                expressions.append("left(log_message, %s) AS log_message")
+                params.append(max_message_chars)
             else:
-                results = cursor.fetchall()
-                results = self.transform_to_objects(query, results) if derive_scheme else results
-                if query_all:
-                    final_results = results
-                if not query_all and len(results) > 0:
-                    final_results = results[0]
+                expressions.append(self.log_select_expressions[field])
+        if operation == "search_logs" and read_request.get("highlight"):
+            expressions.append(f"""ts_headline('{TEXT_SEARCH_CONFIG}', log_message,
+                websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %s), %s) AS highlight""")
+            params.extend([read_request["query"], HEADLINE_OPTIONS])
+        return ", ".join(expressions), params
+
+    def get_pool_metrics(self):
+        return self.pool.get_metrics()
+
+    def get_prepared_statement(self, query):
+        """Returns the name of a query with %s parameters and the query with positional ones,
+        names are derived from the query text, so every process prepares the same statements"""
+        prepared_statement = self.prepared_statements.get(query)
+        if prepared_statement is None:
+            parts = query.split("%s")
+            statement = parts[0] + "".join(f"${idx}{part}" for idx, part in enumerate(parts[1:], 1))
+            name = f"{self.rp_logs_name}_{hashlib.md5(query.encode('utf-8')).hexdigest()[:16]}"
+            prepared_statement = self.prepared_statements.setdefault(query, (name, statement))
+        return prepared_statement
+
+    def execute(self, cursor, query, params=None, prepare=False):
+        if prepare:
+            name, statement = self.get_prepared_statement(query)
+            self.pool.execute_prepared(cursor, name, statement, params or ())
+        else:
+            cursor.execute(query, params)
+
+    def query_rows(self, query, params=None, prepare=False):
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor, STAGE_LATENCY.labels("db").time():
+                self.execute(cursor, query, params, prepare=prepare)
+                return [column[0] for column in cursor.description], cursor.fetchall()
+
+    def query_logs(self, query, params=None):
+        """Runs a prepared query selecting log columns and decodes every row straight into a log"""
+        self.ensure_schema()
+        try:
+            columns, rows = self.query_rows(query, params, prepare=True)
+            with STAGE_LATENCY.labels("objects").time():
+                return list(map(self.get_row_decoder(columns), rows))
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while connecting to PostgreSQL %s", error)
+            return []
+
+    def get_logs_page(self, conditions, params, limit, cursor=None, select_list=None):
+        """Returns a page of logs and the cursor of the next one, pages are read
+        by the (log_time, id) keyset, so deep pages cost as much as the first one"""
+        self.ensure_schema()
+        if cursor is not None:
+            page_state = utils.decode_cursor(cursor)
+            if not isinstance(page_state.get("log_time"), str) or not isinstance(page_state.get("id"), int):
+                raise ValueError(f"Invalid cursor '{cursor}'")
+            conditions += " AND (log_time, id) > (%s::timestamp, %s)"
+            params = params + [page_state["log_time"], page_state["id"]]
+        select_columns, select_params = select_list or (self.log_select_columns, [])
+        try:
+            columns, rows = self.query_rows(f"""
+                SELECT {select_columns}, log_time::text AS page_log_time, id AS page_id
+                  FROM {self.rp_logs_name}
+                 WHERE {conditions}
+                 ORDER BY log_time, id
+                 LIMIT %s""", select_params + params + [limit], prepare=True)
         except (Exception, psycopg2.Error) as error:
             logger.error("Error while connecting to PostgreSQL %s", error)
-        finally:
-            if(connection):
-                cursor.close()
-                connection.close()
-        return final_results
-
-    def commit_to_db(self, query):
-        connection = None
+            return [], None
+        logs = list(map(self.get_row_decoder(columns), rows))
+        if len(rows) < limit:
+            return logs, None
+        return logs, utils.encode_cursor({"log_time": rows[-1][-2], "id": rows[-1][-1]})
+
+    def iter_logs(self, query, params=None):
+        """Yields logs of a query, fetching them in chunks through a server-side cursor,
+        which can't run prepared statements, so the query is only parameterized"""
+        self.ensure_schema()
         try:
-            connection = self.connect_to_db()
+            with self.pool.connection() as connection:
+                with connection.cursor(name=f"{self.rp_logs_name}_stream") as cursor:
+                    cursor.itersize = self.cursor_itersize
+                    cursor.execute(query, params)
+                    decoder = None
+                    for row in cursor:
+                        if decoder is None:
+                            decoder = self.get_row_decoder(
+                                [column[0] for column in cursor.description])
+                        yield decoder(row)
+        except (Exception, psycopg2.Error) as error:
+            # a partially sent stream can't be completed, the caller has to mark it broken
+            logger.error("Error while streaming from PostgreSQL %s", error)
+            raise
 
-            cursor = connection.cursor()
-            cursor.execute(query)
-            connection.commit()
+    def commit_to_db(self, query, params=None, prepare=False):
+        try:
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    self.execute(cursor, query, params, prepare=prepare)
+                connection.commit()
         except (Exception, psycopg2.Error) as error:
             logger.error("Error while connecting to PostgreSQL %s", error)
             return False
-        finally:
-            if(connection):
-                cursor.close()
-                connection.close()
         return True
 
     def insert_to_db(self, query, values_pattern, inserted_values):
-        connection = None
         try:
-            connection = self.connect_to_db()
-
-            cursor = connection.cursor()
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    args_str = ','.join(
+                        cursor.mogrify(values_pattern, x).decode('utf8') for x in inserted_values)
 
-            args_str = ','.join(
-                cursor.mogrify(values_pattern, x).decode('utf8') for x in inserted_values)
+                    # Execute the above SQL string
+                    cursor.execute(query + args_str)
 
-            # Execute the above SQL string
-            cursor.execute(query + args_str)
+                    # Commit transaction and prints the result successfully
+                    connection.commit()
 
-            # Commit transaction and prints the result successfully
-            connection.commit()
-
-            # Get a total of the inserted records
-            count = cursor.rowcount
+                    # Get a total of the inserted records
+                    count = cursor.rowcount
+            ROWS_INSERTED.inc(count)
             logger.debug("Successfully inserted %s records.", count)
         except (Exception, psycopg2.Error) as error:
             logger.error("Error while committing to PostgreSQL %s", error)
             return 0
-        finally:
-            if(connection):
-                cursor.close()
-                connection.close()
         return count
 
+    def copy_to_db(self, table_name, columns, rows):
+        """Streams rows through COPY FROM STDIN, returns the row count of every batch"""
+        copy_query = f"COPY {table_name} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        batch_counts = []
+        rows = iter(rows)
+        try:
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    while True:
+                        batch = islice(rows, self.copy_batch_size)
+                        first_row = next(batch, None)
+                        if first_row is None:
+                            break
+                        cursor.copy_expert(copy_query, CsvCopyStream(chain([first_row], batch)))
+                        batch_counts.append(cursor.rowcount)
+                connection.commit()
+            ROWS_INSERTED.inc(sum(batch_counts))
+            logger.debug("Successfully copied %s records in batches %s.", sum(batch_counts), batch_counts)
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while copying to PostgreSQL %s", error)
+            return []
+        return batch_counts
+
     def delete_project(self, project_id):
+        self.truncate_exclusive_partitions(
+            [name for _, name in self.get_month_partitions()], [project_id])
         query = f"""
                     DELETE FROM {self.rp_logs_name}
-                     WHERE project = {project_id}
+                     WHERE project = %s
                 """
-        delete_res = int(self.commit_to_db(query))
+        delete_res = int(self.commit_to_db(query, [int(project_id)], prepare=True))
         if delete_res != 0:
             logger.info("Deleted project %s", project_id)
         else:
             logger.info("Failed to delete project %s", project_id)
         return delete_res
 
-    def transform_result_to_logs(self, db_results):
-        objects = []
-        for obj in db_results:
-            for column in ["log_time", "last_modified"]:
-                obj[column] = obj[column].strftime("%Y-%m-%d %H:%M:%S")
-            objects.append(launch_objects.Log(**obj))
-        return objects
+    def get_read_query(self, operation, read_request):
+        """Returns the query and the parameters of a read operation"""
+        conditions, params, limit = self.get_read_conditions(operation, read_request)
+        select_columns, select_params = self.get_select_list(operation, read_request)
+        return f"""SELECT {select_columns}
+                     FROM {self.rp_logs_name}
+                    WHERE {conditions} LIMIT %s""", select_params + params + [limit]
 
     def get_logs_by_ids(self, logs_request):
         start_time = time()
-        result = self.query_db(f"""SELECT id,{",".join(self.rp_logs_columns)} FROM {self.rp_logs_name}
-                WHERE id IN ({",".join([str(_id) for _id in logs_request["ids"]])})
-                    AND project={logs_request["project"]} LIMIT 1000""")
+        logs = self.query_logs(*self.get_read_query("get_logs_by_ids", logs_request))
         logger.info("Finished querying for %.2f s", time() - start_time)
-        return self.transform_result_to_logs(result)
+        return logs
+
+    def iter_logs_by_ids(self, logs_request):
+        return self.iter_logs(*self.get_read_query("get_logs_by_ids", logs_request))
 
     def get_logs_by_test_item(self, logs_request):
-        return self.transform_result_to_logs(
-            self.query_db(f"""SELECT id,{",".join(self.rp_logs_columns)} FROM {self.rp_logs_name}
-                WHERE item_id={logs_request["test_item"]}
-                    AND project={logs_request["project"]} LIMIT 1000"""))
+        return self.query_logs(*self.get_read_query("get_logs_by_test_item", logs_request))
+
+    def iter_logs_by_test_item(self, logs_request):
+        return self.iter_logs(*self.get_read_query("get_logs_by_test_item", logs_request))
 
     def delete_logs(self, logs_request):
         project_id = logs_request["project"]
         id_list = logs_request["ids"]
         query = f"""
             DELETE FROM {self.rp_logs_name}
-             WHERE id IN ({",".join([str(_id) for _id in id_list])})
-                   AND project = {project_id}
+             WHERE id = ANY(%s)
+                   AND project = %s
         """
-        delete_res = int(self.commit_to_db(query))
+        delete_res = int(self.commit_to_db(
+            query, [[int(_id) for _id in id_list], int(project_id)], prepare=True))
         if delete_res != 0:
             logger.info("Deleted logs %s from project %s", id_list, project_id)
         else:
@@ -176,13 +353,18 @@ class PostgresClient:
         project_id = logs_request["project"]
         start_date = logs_request["start_date"]
         end_date = logs_request["end_date"]
+        # months lying inside the range are cleared without row deletes where possible
+        self.truncate_exclusive_partitions(
+            [name for month, name in self.get_month_partitions()
+             if str(month) >= start_date[:10] and str(utils.add_months(month, 1)) <= end_date[:10]],
+            [project_id])
         query = f"""
             DELETE FROM {self.rp_logs_name}
-             WHERE log_time >= '{start_date}'
-               AND log_time <= '{end_date}'
-               AND project = {project_id}
+             WHERE log_time >= %s::timestamp
+               AND log_time <= %s::timestamp
+               AND project = %s
         """
-        delete_res = int(self.commit_to_db(query))
+        delete_res = int(self.commit_to_db(query, [start_date, end_date, int(project_id)], prepare=True))
         if delete_res != 0:
             logger.info(
                 "Deleted logs in range (%s, %s) from project %s",
@@ -200,27 +382,121 @@ class PostgresClient:
         return delete_res
 
     def search_logs(self, search_query):
-        return self.transform_result_to_logs(
-            self.query_db(f"""SELECT id,{",".join(self.rp_logs_columns)} FROM {self.rp_logs_name}
-                WHERE to_tsvector(log_message) @@ websearch_to_tsquery('{search_query["query"]}') AND
-                project={search_query["project"]} LIMIT 100"""))
+        return self.query_logs(*self.get_read_query("search_logs", search_query))
 
     def search_logs_by_pattern(self, search_query):
-        regexp_pattern = search_query["query"]
-        project_id = search_query["project"]
-        query = f"""
-            SELECT id,{",".join(self.rp_logs_columns)}
-              FROM {self.rp_logs_name}
-             WHERE log_message ~ '{regexp_pattern}'
-                   AND project = {project_id}
-             LIMIT 100
-        """
-        return self.transform_result_to_logs(self.query_db(query))
+        return self.query_logs(*self.get_read_query("search_logs_by_pattern", search_query))
+
+    def read_logs_page(self, operation, read_request):
+        """Returns a page of a read operation and the cursor of the next one"""
+        conditions, params, limit = self.get_read_conditions(operation, read_request)
+        return self.get_logs_page(conditions, params, limit, cursor=read_request.get("cursor"),
+                                  select_list=self.get_select_list(operation, read_request))
+
+    def get_message_tsv(self):
+        """Returns the stored tsvector column of messages,
+        or the expression computing it while the column migration is pending"""
+        self.ensure_schema()
+        if MESSAGE_TSV_MIGRATION in self.pending_migrations:
+            return f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(log_message, ''))"
+        return "log_message_tsv"
+
+    def get_read_conditions(self, operation, read_request):
+        """Returns conditions, parameters and the limit of a read operation"""
+        if operation == "get_logs_by_ids":
+            conditions, params, default_limit = (
+                "id = ANY(%s) AND project = %s",
+                [[int(_id) for _id in read_request["ids"]], read_request["project"]], 1000)
+        elif operation == "get_logs_by_test_item":
+            conditions, params, default_limit = (
+                "item_id = %s AND project = %s", [read_request["test_item"], read_request["project"]], 1000)
+        elif operation == "search_logs":
+            conditions, params, default_limit = (
+                f"{self.get_message_tsv()} @@ websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %s) "
+                "AND project = %s", [read_request["query"], read_request["project"]], 100)
+        elif operation == "search_logs_by_pattern":
+            conditions, params, default_limit = (
+                "log_message ~ %s AND project = %s", [read_request["query"], read_request["project"]], 100)
+        else:
+            raise ValueError(f"Unsupported operation '{operation}'")
+        return conditions, params, utils.get_read_limit(read_request, default_limit)
+
+    def batch_read(self, read_requests):
+        """Runs read requests as one UNION ALL query on one connection, results are keyed by request id"""
+        self.ensure_schema()
+        results = {}
+        request_fields = {}
+        sub_queries = []
+        params = []
+        for read_request in read_requests:
+            try:
+                conditions, read_params, limit = self.get_read_conditions(
+                    read_request["operation"], read_request["body"])
+                fields = get_requested_fields(read_request["body"])
+            except (KeyError, ValueError) as err:
+                results[read_request["id"]] = {"error": str(err)}
+                continue
+            results[read_request["id"]] = []
+            request_fields[str(read_request["id"])] = fields
+            # the union needs the same columns everywhere, fields that aren't requested are nulls
+            select_columns = ", ".join(
+                self.log_select_expressions[field] if field in (fields or LOG_FIELDS) else f"NULL AS {field}"
+                for field in LOG_FIELDS)
+            sub_queries.append(f"""(SELECT %s AS request_id, {select_columns}
+                                      FROM {self.rp_logs_name} WHERE {conditions} LIMIT %s)""")
+            params.extend([str(read_request["id"])] + read_params + [limit])
+        if not sub_queries:
+            return results
+        try:
+            columns, rows = self.query_rows(" UNION ALL ".join(sub_queries), params)
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while running batch in PostgreSQL %s", error)
+            return self.batch_read_one_by_one(read_requests, results)
+        decoder = self.get_row_decoder(columns)
+        request_ids = {str(request_id): request_id for request_id in results}
+        for row in rows:
+            log = decoder(row)
+            log.fields = request_fields[row[0]]
+            results[request_ids[row[0]]].append(log)
+        return results
+
+    def batch_read_one_by_one(self, read_requests, results):
+        """Isolates failing requests of a batch, reusing a single connection"""
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                for read_request in read_requests:
+                    if isinstance(results[read_request["id"]], dict):
+                        continue
+                    query, params = self.get_read_query(read_request["operation"], read_request["body"])
+                    try:
+                        self.execute(cursor, query, params, prepare=True)
+                        decoder = self.get_row_decoder([column[0] for column in cursor.description])
+                        results[read_request["id"]] = list(map(decoder, cursor.fetchall()))
+                    except psycopg2.Error as error:
+                        connection.rollback()
+                        results[read_request["id"]] = {"error": str(error).strip()}
+        return results
+
+    def is_legacy_table(self):
+        """Checks whether the logs table was created before partitioning was introduced"""
+        _, rows = self.query_rows("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+                                  [self.rp_logs_name])
+        return bool(rows) and rows[0][0] == "r"
 
     def create_log_table(self):
+        """Creates the logs table partitioned by log_time months, each month is partitioned
+        by the project hash, logs out of the created months go to the default partition"""
+        try:
+            legacy = self.is_legacy_table()
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while connecting to PostgreSQL %s", error)
+            return 0
+        if legacy:
+            logger.warning("Table %s isn't partitioned, logs retention will delete rows one by one",
+                           self.rp_logs_name)
         res = self.commit_to_db(f"""
             CREATE TABLE IF NOT EXISTS {self.rp_logs_name} (
-                id BIGSERIAL PRIMARY KEY,
+                id BIGSERIAL,
                 uuid VARCHAR(36) NOT NULL,
                 log_time TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 log_message text,
@@ -229,45 +505,252 @@ class PostgresClient:
                 project BIGINT,
                 last_modified TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 log_level INTEGER,
-                attachment_id BIGINT
-            );
-            CREATE EXTENSION IF NOT EXISTS pg_trgm;
-            CREATE INDEX IF NOT EXISTS rp_log_ti_idx ON {self.rp_logs_name} (item_id);
-            CREATE INDEX IF NOT EXISTS rp_log_message_trgm_idx
-                ON {self.rp_logs_name} USING gin (log_message gin_trgm_ops);
-            CREATE INDEX IF NOT EXISTS rp_log_log_time_idx ON {self.rp_logs_name} USING btree (log_time)
+                attachment_id BIGINT,
+                PRIMARY KEY (id, log_time, project)
+            ) PARTITION BY RANGE (log_time);
+            {"" if legacy else f"CREATE TABLE IF NOT EXISTS {self.rp_logs_name}_default "
+                                f"PARTITION OF {self.rp_logs_name} DEFAULT;"}
+            CREATE TABLE IF NOT EXISTS {self.rp_logs_retention_name} (
+                project BIGINT PRIMARY KEY,
+                keep_logs_days INTEGER NOT NULL
+            )
             """)
+        self.partitioned = res and not legacy
         return int(res)
 
+    def get_partition_name(self, month):
+        return f"{self.rp_logs_name}_y{month.year}m{month.month:02d}"
+
+    def create_month_partition(self, month):
+        partition_name = self.get_partition_name(month)
+        hash_partitions = "".join(
+            f"""CREATE TABLE IF NOT EXISTS {partition_name}_p{remainder} PARTITION OF {partition_name}
+                FOR VALUES WITH (MODULUS {self.project_partitions}, REMAINDER {remainder});"""
+            for remainder in range(self.project_partitions))
+        res = self.commit_to_db(f"""
+            CREATE TABLE IF NOT EXISTS {partition_name} PARTITION OF {self.rp_logs_name}
+                FOR VALUES FROM ('{month}') TO ('{utils.add_months(month, 1)}')
+                PARTITION BY HASH (project);
+            {hash_partitions}
+            """)
+        if res:
+            logger.info("Created partition %s", partition_name)
+        return res
+
+    def ensure_partitions(self, logs):
+        """Creates partitions for the months of the logs and the upcoming months"""
+        if not self.partitioned:
+            return
+        current_month = utils.get_month_start(date.today())
+        months = {utils.add_months(current_month, idx) for idx in range(self.partitions_ahead + 1)}
+        for log in logs:
+            try:
+                months.add(utils.get_month_start(log["log_time"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        for month in sorted(months - self.known_partitions):
+            if self.create_month_partition(month):
+                self.known_partitions.add(month)
+
+    def get_month_partitions(self):
+        """Returns (month, partition name) of the existing month partitions sorted by month"""
+        try:
+            _, rows = self.query_rows("""
+                SELECT child.relname FROM pg_inherits
+                  JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                 WHERE pg_inherits.inhparent = to_regclass(%s)""", [self.rp_logs_name])
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while connecting to PostgreSQL %s", error)
+            return []
+        partitions = []
+        for partition_name, in rows:
+            try:
+                month = datetime.strptime(partition_name[len(self.rp_logs_name):], "_y%Ym%m").date()
+            except ValueError:
+                continue
+            partitions.append((month, partition_name))
+        return sorted(partitions)
+
+    def truncate_exclusive_partitions(self, partition_names, projects):
+        """Truncates the project hash partitions of the month partitions that hold logs
+        of the given projects only, returns the number of truncated partitions"""
+        project_ids = [int(project) for project in projects]
+        truncated = 0
+        for partition_name in partition_names:
+            try:
+                _, rows = self.query_rows("""
+                    SELECT remainder FROM generate_series(0, %s) AS remainder
+                     WHERE EXISTS (SELECT 1 FROM unnest(%s::bigint[]) AS project
+                                    WHERE satisfies_hash_partition(
+                                        %s::regclass::oid, %s, remainder, project))""",
+                                          [self.project_partitions - 1, project_ids,
+                                           partition_name, self.project_partitions])
+                for remainder, in rows:
+                    truncated += self.truncate_exclusive_partition(
+                        f"{partition_name}_p{remainder}", project_ids)
+            except (Exception, psycopg2.Error) as error:
+                logger.error("Error while truncating partitions of %s %s", partition_name, error)
+        return truncated
+
+    def truncate_exclusive_partition(self, partition_name, project_ids):
+        """Truncates a partition if it holds logs of the given projects only. The partition is locked
+        before the check, so no other project can write to it until the truncation is committed,
+        a partition busy with writes is skipped and its logs are left to the row deletion"""
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                try:
+                    cursor.execute("SET LOCAL lock_timeout = %s", [f"{self.truncate_lock_timeout}ms"])
+                    cursor.execute(f"LOCK TABLE {partition_name} IN ACCESS EXCLUSIVE MODE")
+                except psycopg2.errors.LockNotAvailable:
+                    logger.debug("Partition %s is busy, it isn't truncated", partition_name)
+                    connection.rollback()
+                    return 0
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {partition_name} WHERE project <> ALL(%s))",
+                               [project_ids])
+                if cursor.fetchone()[0]:
+                    connection.rollback()
+                    return 0
+                cursor.execute(f"TRUNCATE {partition_name}")
+            connection.commit()
+        return 1
+
+    def drop_empty_partition(self, partition_name):
+        """Drops a partition if it is empty, checking it under the lock the drop takes"""
+        try:
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = %s", [f"{self.truncate_lock_timeout}ms"])
+                    cursor.execute(f"LOCK TABLE {partition_name} IN ACCESS EXCLUSIVE MODE")
+                    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {partition_name})")
+                    if cursor.fetchone()[0]:
+                        connection.rollback()
+                        return False
+                    cursor.execute(f"DROP TABLE {partition_name}")
+                connection.commit()
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while dropping partition %s %s", partition_name, error)
+            return False
+        return True
+
+    def apply_retention(self):
+        """Removes logs older than the retention of their projects. Expired hash partitions
+        are truncated and emptied month partitions are dropped, only the logs left in
+        partitions shared with other projects are deleted row by row"""
+        start_time = time()
+        try:
+            _, policies = self.query_rows(
+                f"SELECT project, keep_logs_days FROM {self.rp_logs_retention_name}")
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while connecting to PostgreSQL %s", error)
+            return 0
+        now = datetime.now()
+        dropped = 0
+        for month, partition_name in self.get_month_partitions():
+            month_end = datetime.combine(utils.add_months(month, 1), datetime.min.time())
+            expired_projects = [project for project, keep_logs_days in policies
+                                if month_end <= now - timedelta(days=keep_logs_days)]
+            if not expired_projects:
+                continue
+            self.truncate_exclusive_partitions([partition_name], expired_projects)
+            if self.drop_empty_partition(partition_name):
+                self.known_partitions.discard(month)
+                dropped += 1
+                logger.info("Dropped expired partition %s", partition_name)
+        self.commit_to_db(f"""
+            DELETE FROM {self.rp_logs_name}
+             USING {self.rp_logs_retention_name}
+             WHERE {self.rp_logs_name}.project = {self.rp_logs_retention_name}.project
+               AND log_time < now() - {self.rp_logs_retention_name}.keep_logs_days * interval '1 day'
+            """)
+        logger.info("Applied logs retention for %.2f s", time() - start_time)
+        return dropped
+
+    def maybe_apply_retention(self):
+        """Applies the retention in the background once per retention interval"""
+        if time() - self.last_retention_time < self.retention_interval:
+            return
+        if not self.retention_lock.acquire(blocking=False):
+            return
+        self.last_retention_time = time()
+
+        def run():
+            try:
+                self.apply_retention()
+            finally:
+                self.retention_lock.release()
+        threading.Thread(target=run, name="postgres-retention", daemon=True).start()
+
+    def migrate_schema(self):
+        """Applies the schema migrations, indexes are created there"""
+        try:
+            with self.pool.connection() as connection:
+                apply_migrations(connection, self.rp_logs_name)
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while migrating PostgreSQL schema %s", error)
+            return False
+        return True
+
+    def check_schema_migrations(self):
+        """Migrates an empty logs table right away, migrations of a filled one can lock it for long,
+        so they are left to scripts/migrate_postgres.py unless automatic migrations are enabled"""
+        try:
+            with self.pool.connection() as connection:
+                pending = get_pending_migrations(connection, self.rp_logs_name)
+            if not pending:
+                return True
+            _, rows = self.query_rows(f"SELECT EXISTS (SELECT 1 FROM {self.rp_logs_name})")
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while checking PostgreSQL migrations %s", error)
+            return False
+        if not rows[0][0] or self.app_config.get("postgresAutoMigrate"):
+            return self.migrate_schema()
+        logger.warning("Migrations %s of %s aren't applied, run scripts/migrate_postgres.py and restart, "
+                       "searches compute message vectors without an index meanwhile",
+                       pending, self.rp_logs_name)
+        self.pending_migrations = pending
+        return True
+
+    def ensure_schema(self):
+        """Bootstraps the logs table and checks its migrations once per process"""
+        if not self.schema_initialized:
+            with self.schema_lock:
+                if not self.schema_initialized:
+                    self.schema_initialized = bool(self.create_log_table()) and self.check_schema_migrations()
+        return self.schema_initialized
+
+    def prepare_log_rows(self, logs, project_id, columns):
+        for obj in logs:
+            yield [project_id if column == "project" else obj[column] for column in columns]
+
     def index_logs(self, index_query):
-        if self.create_log_table():
-            columns = ["uuid", "log_time", "log_message", "item_id", "launch_id",
-                       "project", "last_modified", "log_level", "attachment_id"]
-            logs = index_query["logs"]
-            project_id = index_query["project"]
-            objects = []
-            used_columns = []
-            for obj in logs:
-                obj_row = []
-                if "id" in obj:
-                    obj_row.append(obj["id"])
-                    if not len(used_columns):
-                        used_columns = ["id"] + columns
-                if not len(used_columns):
-                    used_columns = columns
-                for column in columns:
-                    if column == "project":
-                        obj_row.append(project_id)
-                    else:
-                        obj_row.append(obj[column])
-                objects.append(obj_row)
-            insert_query = f"""
-                INSERT INTO {self.rp_logs_name} ({",".join(used_columns)})
-                VALUES """
-            values_pattern = f"""({",".join(["%s"] * len(used_columns))})"""
-            return self.insert_to_db(insert_query, values_pattern, objects)
-        return 0
+        logs = index_query["logs"]
+        if not logs or not self.ensure_schema():
+            return 0
+        project_id = index_query["project"]
+        used_columns = ["id"] + self.rp_logs_columns if "id" in logs[0] else self.rp_logs_columns
+        self.ensure_partitions(logs)
+        self.maybe_apply_retention()
+        rows = self.prepare_log_rows(logs, project_id, used_columns)
+        if self.ingest_mode == "copy":
+            return sum(self.copy_to_db(self.rp_logs_name, used_columns, rows))
+        insert_query = f"""
+            INSERT INTO {self.rp_logs_name} ({",".join(used_columns)})
+            VALUES """
+        values_pattern = f"""({",".join(["%s"] * len(used_columns))})"""
+        return self.insert_to_db(insert_query, values_pattern, rows)
 
     def update_policy_keep_logs_days(self, update_query):
-        logger.warning("Trying to update policy for postgres client that doesn't implement ILM logic.")
-        return 0
+        """Stores the retention of a project, expired partitions are dropped in the background"""
+        if not self.ensure_schema():
+            return 0
+        project_id = int(update_query["project"])
+        keep_logs_days = int(update_query["keep_logs_days"])
+        res = self.commit_to_db(f"""
+            INSERT INTO {self.rp_logs_retention_name} (project, keep_logs_days)
+            VALUES (%s, %s)
+            ON CONFLICT (project) DO UPDATE SET keep_logs_days = EXCLUDED.keep_logs_days
+            """, [project_id, keep_logs_days])
+        if res:
+            self.last_retention_time = 0
+            self.maybe_apply_retention()
+        return int(res)
@@ -0,0 +1,136 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import logging
+from time import time
+
+logger = logging.getLogger("esLogsService.postgresMigrations")
+
+# the generated column needs an immutable expression, so the configuration is fixed
+TEXT_SEARCH_CONFIG = "english"
+# searches compute the vector of every message until the stored column is added
+MESSAGE_TSV_MIGRATION = 2
+
+# (version, description, steps), a step is either a statement formatted with the logs table name
+# or an (index name, index definition) pair of an index created concurrently, so writes go on.
+# Steps run outside of a transaction, they are idempotent, so a failed migration is simply rerun.
+# Migration 2 rewrites the whole table to store the generated column, on a large table it holds
+# an exclusive lock for the time of the rewrite, so it's applied by scripts/migrate_postgres.py
+MIGRATIONS = [
+    (1, "Indexes leading with project for item and time reads", [
+        ("{table}_project_item_idx", "(project, item_id)"),
+        ("{table}_project_time_idx", "(project, log_time, id)"),
+        "DROP INDEX IF EXISTS rp_log_ti_idx",
+        "DROP INDEX IF EXISTS rp_log_log_time_idx",
+    ]),
+    (2, "Stored tsvector of messages for full-text search", [
+        f"""ALTER TABLE {{table}} ADD COLUMN IF NOT EXISTS log_message_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(log_message, ''))) STORED""",
+        ("{table}_message_tsv_idx", "USING gin (log_message_tsv)"),
+    ]),
+    (3, "Trigram index of messages per project", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE EXTENSION IF NOT EXISTS btree_gin",
+        ("{table}_project_message_trgm_idx", "USING gin (project, log_message gin_trgm_ops)"),
+        "DROP INDEX IF EXISTS rp_log_message_trgm_idx",
+    ]),
+    (4, "Index of test item pages ordered by time", [
+        ("{table}_project_item_time_idx", "(project, item_id, log_time, id)"),
+        "DROP INDEX IF EXISTS {table}_project_item_idx",
+    ]),
+]
+
+
+def create_migrations_table(cursor, table_name):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name}_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )""")
+
+
+def get_pending_migrations(connection, table_name, migrations=MIGRATIONS):
+    """Returns the versions of the migrations not applied yet"""
+    with connection.cursor() as cursor:
+        create_migrations_table(cursor, table_name)
+        cursor.execute(f"SELECT version FROM {table_name}_migrations")
+        applied = {version for version, in cursor.fetchall()}
+    connection.commit()
+    return [version for version, _, _ in sorted(migrations) if version not in applied]
+
+
+def create_index_concurrently(cursor, table_name, index_name, definition):
+    """Creates an index without blocking writes. Partitioned tables can't be indexed concurrently,
+    so their index is created on the parent only and the indexes of the partitions, built
+    concurrently, are attached to it, which makes it valid once every partition has one"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [table_name])
+    if cursor.fetchone()[0] != "p":
+        # an interrupted concurrent build leaves an invalid index behind, IF NOT EXISTS would keep it
+        cursor.execute("""
+            SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid""", [index_name])
+        if cursor.fetchone() is not None:
+            cursor.execute(f"DROP INDEX CONCURRENTLY {index_name}")
+        cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} {definition}")
+        return
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON ONLY {table_name} {definition}")
+    cursor.execute("""
+        SELECT inhrelid::regclass::text FROM pg_inherits
+         WHERE inhparent = %s::regclass ORDER BY 1""", [table_name])
+    for partition_name, in cursor.fetchall():
+        cursor.execute("""
+            SELECT 1 FROM pg_inherits JOIN pg_index ON pg_index.indexrelid = pg_inherits.inhrelid
+             WHERE pg_inherits.inhparent = %s::regclass AND pg_index.indrelid = %s::regclass""",
+                       [index_name, partition_name])
+        if cursor.fetchone() is not None:
+            continue
+        partition_index_name = partition_name + index_name[len(table_name):]
+        create_index_concurrently(cursor, partition_name, partition_index_name, definition)
+        cursor.execute(f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index_name}")
+
+
+def apply_migrations(connection, table_name, migrations=MIGRATIONS):
+    """Applies the migrations missing in the database in version order under an advisory lock,
+    so concurrent runs apply a migration once. Returns the versions applied by this call"""
+    applied = []
+    connection.commit()
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            create_migrations_table(cursor, table_name)
+            cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", [f"{table_name}_migrations"])
+            try:
+                for version, description, steps in sorted(migrations):
+                    cursor.execute(f"SELECT 1 FROM {table_name}_migrations WHERE version = %s", [version])
+                    if cursor.fetchone() is not None:
+                        continue
+                    start_time = time()
+                    for step in steps:
+                        if isinstance(step, tuple):
+                            create_index_concurrently(cursor, table_name, step[0].format(table=table_name),
+                                                      step[1])
+                        else:
+                            cursor.execute(step.format(table=table_name))
+                    cursor.execute(
+                        f"INSERT INTO {table_name}_migrations (version, description) VALUES (%s, %s)",
+                        [version, description])
+                    applied.append(version)
+                    logger.info("Applied migration %d '%s' for %.2f s", version, description,
+                                time() - start_time)
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [f"{table_name}_migrations"])
+    finally:
+        connection.autocommit = False
+    return applied
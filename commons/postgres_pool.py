@@ -0,0 +1,186 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import logging
+import threading
+import psycopg2
+import psycopg2.extensions
+from contextlib import contextmanager
+from time import time
+
+logger = logging.getLogger("esLogsService.postgresPool")
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection is released back to the pool in time"""
+
+
+class PostgresConnectionPool:
+    """Bounded thread-safe pool of psycopg2 connections"""
+    def __init__(self, connect, max_size=10, timeout=30, health_check_interval=30):
+        self.connect = connect
+        self.max_size = max(1, int(max_size))
+        self.timeout = float(timeout)
+        self.health_check_interval = float(health_check_interval)
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._prepared = {}
+        self._metrics = {
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "prepared_statements": 0,
+        }
+
+    def _create_connection(self):
+        connection = self.connect()
+        with self._condition:
+            self._metrics["connections_created"] += 1
+        return connection
+
+    def _close_connection(self, connection):
+        self._prepared.pop(id(connection), None)
+        try:
+            connection.close()
+        except psycopg2.Error as err:
+            logger.debug("Error while closing PostgreSQL connection %s", err)
+        with self._condition:
+            self._metrics["connections_discarded"] += 1
+
+    def _is_healthy(self, connection, released_at):
+        if connection.closed:
+            return False
+        if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time() - released_at < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error as err:
+            logger.warning("Discarding broken PostgreSQL connection: %s", err)
+            return False
+
+    def getconn(self):
+        """Checks out a healthy connection, waiting up to the pool timeout"""
+        start_time = time()
+        deadline = start_time + self.timeout
+        connection = None
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time()
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No PostgreSQL connection available after {self.timeout:.2f} s")
+                self._condition.wait(remaining)
+            self._in_use += 1
+        try:
+            if connection is not None and not self._is_healthy(connection, released_at):
+                self._close_connection(connection)
+                connection = None
+            if connection is None:
+                connection = self._create_connection()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        wait_time = time() - start_time
+        with self._condition:
+            self._metrics["checkouts"] += 1
+            self._metrics["wait_time_total"] += wait_time
+            self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], wait_time)
+        return connection
+
+    def putconn(self, connection, discard=False):
+        """Returns a connection to the pool, rolling back any open transaction"""
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error as err:
+                logger.warning("Unable to reset PostgreSQL connection: %s", err)
+                discard = True
+        if discard or connection.closed:
+            self._close_connection(connection)
+            with self._condition:
+                self._size -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            self._idle.append((connection, time()))
+            self._in_use -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.getconn()
+        discard = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(connection, discard=discard)
+
+    def execute_prepared(self, cursor, name, statement, params=()):
+        """Executes a server-side prepared statement, preparing it once per connection"""
+        prepared = self._prepared.setdefault(id(cursor.connection), set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            prepared.add(name)
+            with self._condition:
+                self._metrics["prepared_statements"] += 1
+        if params:
+            cursor.execute(f"EXECUTE {name} ({','.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def get_metrics(self):
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics["size"] = self._size
+            metrics["max_size"] = self.max_size
+            metrics["idle"] = len(self._idle)
+            metrics["in_use"] = self._in_use
+        metrics["wait_time_avg"] = metrics["wait_time_total"] / metrics["checkouts"]\
+            if metrics["checkouts"] else 0.0
+        return metrics
+
+    def close_all(self):
+        with self._condition:
+            idle = self._idle
+            self._idle = []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close_connection(connection)
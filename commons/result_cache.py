@@ -0,0 +1,180 @@
+"""
+* Copyright 2019 EPAM Systems
+*
+* Licensed under the Apache License, Version 2.0 (the "License");
+* you may not use this file except in compliance with the License.
+* You may obtain a copy of the License at
+*
+* http://www.apache.org/licenses/LICENSE-2.0
+*
+* Unless required by applicable law or agreed to in writing, software
+* distributed under the License is distributed on an "AS IS" BASIS,
+* WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+* See the License for the specific language governing permissions and
+* limitations under the License.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from time import sleep, time
+
+logger = logging.getLogger("esLogsService.resultCache")
+
+CACHED_OPERATIONS = ["get_logs_by_ids", "get_logs_by_test_item", "search_logs", "search_logs_by_pattern"]
+
+# rough per-log overhead of the object and its small fields on top of the message text
+LOG_OVERHEAD_BYTES = 400
+
+
+def estimate_logs_size(logs):
+    return sum(len(log.log_message or "") + LOG_OVERHEAD_BYTES for log in logs)
+
+
+class ResultCache:
+    """LRU cache of read results bounded by an estimated size, entries expire after ttl"""
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=30):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get_generation(self, project):
+        with self.lock:
+            return self.generations.get(project, 0)
+
+    def _remove(self, key):
+        _, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry[1] < time():
+                self._remove(key)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, size, generation):
+        """Stores a value unless its project was written after the value had been read"""
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if self.generations.get(key[0], 0) != generation:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, time() + self.ttl, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate_project(self, project):
+        with self.lock:
+            self.generations[project] = self.generations.get(project, 0) + 1
+            keys = [key for key in self.entries if key[0] == project]
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidations"] += len(keys)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.total_bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+class CachedDatabaseClient:
+    """Serves repeated reads of a database client from the result cache,
+    writes drop the cached results of their project. Only writes of this process are seen,
+    so the cache is safe only when this process is the single writer of the database"""
+    def __init__(self, database_client, result_cache, task_poll_interval=1.0):
+        self.database_client = database_client
+        self.result_cache = result_cache
+        self.task_poll_interval = task_poll_interval
+
+    def __getattr__(self, name):
+        if name in CACHED_OPERATIONS:
+            return lambda logs_request: self.cached_read(name, logs_request)
+        return getattr(self.database_client, name)
+
+    def get_cache_key(self, operation, logs_request):
+        normalized_request = {key: value for key, value in logs_request.items() if key != "project"}
+        if operation == "get_logs_by_ids":
+            normalized_request["ids"] = sorted(normalized_request["ids"], key=str)
+        return str(logs_request["project"]), operation, json.dumps(normalized_request, sort_keys=True)
+
+    def cached_read(self, operation, logs_request):
+        key = self.get_cache_key(operation, logs_request)
+        logs = self.result_cache.get(key)
+        if logs is None:
+            generation = self.result_cache.get_generation(key[0])
+            logs = getattr(self.database_client, operation)(logs_request)
+            self.result_cache.put(key, logs, estimate_logs_size(logs), generation)
+        return logs
+
+    def index_logs(self, index_query):
+        try:
+            return self.database_client.index_logs(index_query)
+        finally:
+            self.result_cache.invalidate_project(str(index_query["project"]))
+
+    def watch_task(self, task, project):
+        """Drops the cached results of a project once its background deletion task completes"""
+        def wait_for_task():
+            while True:
+                try:
+                    status = self.database_client.get_task(task["task"])
+                except Exception as err:
+                    logger.error("Unable to get the status of task %s: %s", task["task"], err)
+                    status = None
+                if status is None or status["completed"]:
+                    self.result_cache.invalidate_project(project)
+                    return
+                sleep(self.task_poll_interval)
+        threading.Thread(target=wait_for_task, daemon=True).start()
+
+    def delete_logs(self, logs_request):
+        result = None
+        try:
+            result = self.database_client.delete_logs(logs_request)
+            return result
+        finally:
+            self.result_cache.invalidate_project(str(logs_request["project"]))
+            if isinstance(result, dict) and "task" in result:
+                self.watch_task(result, str(logs_request["project"]))
+
+    def delete_logs_by_date(self, logs_request):
+        result = None
+        try:
+            result = self.database_client.delete_logs_by_date(logs_request)
+            return result
+        finally:
+            self.result_cache.invalidate_project(str(logs_request["project"]))
+            if isinstance(result, dict) and "task" in result:
+                self.watch_task(result, str(logs_request["project"]))
+
+    def delete_project(self, project_id):
+        try:
+            return self.database_client.delete_project(project_id)
+        finally:
+            self.result_cache.invalidate_project(str(project_id))
+
+    def update_policy_keep_logs_days(self, update_query):
+        try:
+            return self.database_client.update_policy_keep_logs_days(update_query)
+        finally:
+            self.result_cache.invalidate_project(str(update_query["project"]))
@@ -0,0 +1,25 @@
+import json
+import sys
+sys.path.append('..')
+
+from commons.postgres_client import PostgresClient
+from commons.postgres_migrations import apply_migrations, get_pending_migrations
+from postgres_config import POSTGRES_CONFIG
+
+APP_CONFIG = POSTGRES_CONFIG
+
+
+def perform_migrations():
+    """Applies the pending migrations of the logs table, the service can keep running meanwhile"""
+    client = PostgresClient(APP_CONFIG)
+    if not client.create_log_table():
+        raise RuntimeError("Unable to create the logs table")
+    with client.pool.connection() as connection:
+        pending = get_pending_migrations(connection, client.rp_logs_name)
+        print(json.dumps({"pending": pending}))
+        applied = apply_migrations(connection, client.rp_logs_name)
+    print(json.dumps({"applied": applied}))
+    client.pool.close_all()
+
+
+perform_migrations()
@@ -0,0 +1,10 @@
+import os
+
+# connection settings of the PostgreSQL scripts, read from the same variables as the service
+POSTGRES_CONFIG = {
+    "postgresUser":      os.getenv("POSTGRES_USER", "rpuser"),
+    "postgresPassword":  os.getenv("POSTGRES_PASSWORD", "rppass"),
+    "postgresDatabase":  os.getenv("POSTGRES_DB", "reportportal"),
+    "postgresHost":      os.getenv("POSTGRES_HOST", "localhost"),
+    "postgresPort":      os.getenv("POSTGRES_PORT", 5432),
+}
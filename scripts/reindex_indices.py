@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import sys
+sys.path.append('..')
+
+from commons.es_client import EsClient
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--projects', default="")
+parser.add_argument('--shared', action='store_true')
+parser.add_argument('--shards', default=os.getenv("ES_NUMBER_OF_SHARDS", 1))
+parser.add_argument('--replicas', default=os.getenv("ES_NUMBER_OF_REPLICAS", 0))
+parser.add_argument('--refresh_interval', default=os.getenv("ES_REFRESH_INTERVAL", ""))
+parser.add_argument('--codec', default=os.getenv("ES_INDEX_CODEC", "default"))
+parser.add_argument('--pattern_field', default=os.getenv("ES_PATTERN_FIELD", "keyword"))
+args = parser.parse_args()
+
+args.projects = [project.strip() for project in args.projects.split(",") if project.strip()]
+print("Projects: ", args.projects)
+print("Shared index: ", args.shared)
+print("Shards: ", args.shards)
+print("Replicas: ", args.replicas)
+print("Refresh interval: ", args.refresh_interval)
+print("Codec: ", args.codec)
+print("Pattern field: ", args.pattern_field)
+
+APP_CONFIG = {
+    "esHost":            os.getenv("ES_HOSTS", "http://localhost:9200").strip("/").strip("\\"),
+    "esIndexPrefix":     os.getenv("ES_INDEX_PREFIX", "rp_"),
+    "esSharedIndexName": os.getenv("ES_SHARED_INDEX_NAME", "").strip(),
+    "esReindexTimeout":  float(os.getenv("ES_REINDEX_TIMEOUT", 3600)),
+    "esNumberOfShards":  int(args.shards),
+    "esNumberOfReplicas": int(args.replicas),
+    "esRefreshInterval": args.refresh_interval,
+    "esIndexCodec":      args.codec,
+    "esPatternField":    args.pattern_field,
+    "esProjectTemplateSettings": json.loads(os.getenv("ES_PROJECT_TEMPLATE_SETTINGS", "{}")),
+}
+
+
+def perform_reindexing():
+    """Migrates existing indices to the template options, reads keep working meanwhile,
+    the service has to run with the same options, so pattern searches use the new fields"""
+    client = EsClient(APP_CONFIG)
+    results = []
+    for project in args.projects:
+        results.append(dict(client.reindex_project(project), project=project))
+    if args.shared:
+        results.append(dict(client.reindex_shared_index(), project="shared"))
+    for result in results:
+        print(json.dumps(result))
+
+
+perform_reindexing()
@@ -0,0 +1,185 @@
+import argparse
+import json
+import sys
+sys.path.append('..')
+
+from commons.amqp_consumer import AmqpConsumer
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--message_num', default=230)
+parser.add_argument('--failed_every', default=37)
+parser.add_argument('--prefetch_count', default=100)
+parser.add_argument('--ack_batch_size', default=50)
+parser.add_argument('--max_retries', default=3)
+args = parser.parse_args()
+
+args.message_num = int(args.message_num)
+args.failed_every = int(args.failed_every)
+args.prefetch_count = int(args.prefetch_count)
+args.ack_batch_size = int(args.ack_batch_size)
+args.max_retries = int(args.max_retries)
+print("Message num: ", args.message_num)
+print("Failed every: ", args.failed_every)
+
+
+LOG = {"uuid": "2dec50f6-3a44-4756-8dcc-b1d22ad70bdb", "log_time": "2021-05-04 15:20:44",
+       "log_message": "test", "item_id": 5000, "launch_id": 500, "last_modified": "2021-05-04 15:20:44",
+       "log_level": 40000, "attachment_id": 5000}
+
+FAILURE_KINDS = ["flaky", "down", "invalid", "partial"]
+
+
+class FakeMethodFrame:
+    def __init__(self, delivery_tag, routing_key):
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+
+
+class FakeProperties:
+    def __init__(self, message_type=None, headers=None):
+        self.type = message_type
+        self.headers = headers
+
+
+class FakeChannel:
+    """In-memory stand-in of a pika channel, it delivers the queued messages and the ones
+    published to the queue meanwhile, then reports inactivity and stops the consumer"""
+    def __init__(self, messages, consumer):
+        self.messages = messages
+        self.consumer = consumer
+        self.declared_queues = []
+        self.dead_letters = []
+        self.prefetch_count = None
+        self.acks = []
+        self.nacks = []
+        self.cancelled = False
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def queue_declare(self, queue, **kwargs):
+        self.declared_queues.append(queue)
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def consume(self, queue_name, inactivity_timeout=None):
+        delivery_tag = 0
+        while delivery_tag < len(self.messages):
+            routing_key, body, properties = self.messages[delivery_tag]
+            delivery_tag += 1
+            yield FakeMethodFrame(delivery_tag, routing_key), properties, body
+        self.consumer.stopped.set()
+        yield None, None, None
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        if routing_key == self.consumer.queue_name:
+            self.messages.append((routing_key, body, properties))
+        else:
+            self.dead_letters.append((routing_key, body, properties))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeConnection:
+    def __init__(self, channel):
+        self.fake_channel = channel
+        self.is_open = True
+
+    def channel(self):
+        return self.fake_channel
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeDatabaseClient:
+    """Fails the way the database clients do: flaky projects raise on the first writes,
+    projects of a database that is down get nothing written, partial ones lose a log"""
+    def __init__(self, kinds):
+        self.kinds = kinds
+        self.attempts = {}
+        self.indexed = []
+
+    def index_logs(self, index_query):
+        project = index_query["project"]
+        self.attempts[project] = self.attempts.get(project, 0) + 1
+        kind = self.kinds.get(project)
+        if kind == "flaky" and self.attempts[project] <= args.max_retries - 1:
+            raise RuntimeError("Database is unavailable")
+        if kind == "down":
+            return {"indexed": 0, "errors": []}
+        if kind == "partial":
+            return {"indexed": len(index_query["logs"]) - 1, "errors": [{"status": 400}]}
+        self.indexed.append(project)
+        return {"indexed": len(index_query["logs"]), "errors": []}
+
+
+def get_acked_tags(channel):
+    acked = set()
+    for delivery_tag, multiple in channel.acks:
+        acked.update(range(1, delivery_tag + 1) if multiple else [delivery_tag])
+    return acked
+
+
+def perform_testing():
+    messages = []
+    kinds = {}
+    for idx in range(args.message_num):
+        project = idx
+        logs = [LOG, LOG]
+        if idx % args.failed_every == args.failed_every - 1:
+            kinds[project] = FAILURE_KINDS[idx // args.failed_every % len(FAILURE_KINDS)]
+        if kinds.get(project) == "invalid":
+            logs = [{"log_message": "test"}]
+        messages.append(("index_logs", json.dumps({"logs": logs, "project": project}), FakeProperties()))
+    database_client = FakeDatabaseClient(kinds)
+    consumer = AmqpConsumer(database_client, None, prefetch_count=args.prefetch_count,
+                            ack_batch_size=args.ack_batch_size, ack_interval=60,
+                            max_retries=args.max_retries, retry_delay=0)
+    channel = FakeChannel(list(messages), consumer)
+    consumer.connection_factory = lambda: FakeConnection(channel)
+    consumer.run_consumer()
+
+    dead_letters = {json.loads(body)["project"]: properties.headers["x-retries"]
+                    for _, body, properties in channel.dead_letters}
+    expected_dead_letters = {project: args.max_retries if kind == "down" else 0
+                             for project, kind in kinds.items() if kind != "flaky"}
+    expected_indexed = sorted(project for project in range(args.message_num)
+                              if kinds.get(project) in [None, "flaky"])
+    result = {
+        "prefetch_count": channel.prefetch_count,
+        "deliveries": len(channel.messages),
+        "acks": len(channel.acks),
+        "nacks": len(channel.nacks),
+        "indexed": len(database_client.indexed),
+        "dead_letters": len(channel.dead_letters),
+        "passed": all([
+            channel.prefetch_count == args.prefetch_count,
+            consumer.dead_letter_queue_name in channel.declared_queues,
+            bool(channel.acks) and all(multiple for _, multiple in channel.acks),
+            len(channel.acks) < len(channel.messages),
+            not channel.nacks,
+            get_acked_tags(channel) == set(range(1, len(channel.messages) + 1)),
+            sorted(database_client.indexed) == expected_indexed,
+            dead_letters == expected_dead_letters,
+            len(channel.dead_letters) == len(expected_dead_letters),
+            channel.cancelled,
+        ]),
+    }
+    print(json.dumps(result))
+    if not result["passed"]:
+        sys.exit(1)
+
+
+perform_testing()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import sys
+sys.path.append('..')
+
+from commons.postgres_client import PostgresClient
+from postgres_config import POSTGRES_CONFIG
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--project', default=100)
+parser.add_argument('--test_item', default=5000)
+parser.add_argument('--query', default="assertion error")
+parser.add_argument('--pattern', default="Assert.*Error")
+args = parser.parse_args()
+
+args.project = int(args.project)
+args.test_item = int(args.test_item)
+print("Project: ", args.project)
+print("Test item: ", args.test_item)
+
+APP_CONFIG = POSTGRES_CONFIG
+
+READ_REQUESTS = [
+    ("get_logs_by_ids", {"ids": [1, 2, 3], "project": args.project}),
+    ("get_logs_by_test_item", {"test_item": args.test_item, "project": args.project}),
+    ("search_logs", {"query": args.query, "project": args.project}),
+    ("search_logs_by_pattern", {"query": args.pattern, "project": args.project}),
+]
+
+
+def get_plan_nodes(plan):
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(get_plan_nodes(child))
+    return nodes
+
+
+def explain(client, query, params):
+    """Returns the plan nodes of a query, sequential scans are disabled,
+    so a sequential scan in the plan means no index can serve the query"""
+    with client.pool.connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+            return get_plan_nodes(cursor.fetchone()[0][0]["Plan"])
+
+
+def check_query(client, name, query, params, index_suffix=None):
+    """A query passes without sequential scans of logs, a page query has to be served in order
+    by the index with the given suffix, so every page costs the same"""
+    nodes = explain(client, query, params)
+    seq_scans = sorted({node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"})
+    seq_scans = [relation for relation in seq_scans if relation.startswith(client.rp_logs_name)]
+    index_scans = sorted({node["Index Name"] for node in nodes if "Index Name" in node})
+    sorted_rows = any(node["Node Type"] == "Sort" for node in nodes)
+    passed = not seq_scans
+    if index_suffix is not None:
+        passed = passed and not sorted_rows and bool(index_scans) \
+            and all(index.endswith(index_suffix) for index in index_scans)
+    result = {
+        "endpoint": name,
+        "passed": passed,
+        "seq_scans": seq_scans,
+        "index_scans": index_scans,
+        "sorted": sorted_rows,
+    }
+    print(json.dumps(result))
+    return result["passed"]
+
+
+def perform_testing():
+    client = PostgresClient(APP_CONFIG)
+    if not client.ensure_schema():
+        raise RuntimeError("Unable to initialize the schema")
+    select = f"SELECT {client.log_select_columns} FROM {client.rp_logs_name}"
+    checks = []
+    for operation, read_request in READ_REQUESTS:
+        conditions, params, limit = client.get_read_conditions(operation, read_request)
+        checks.append((operation, f"{select} WHERE {conditions} LIMIT %s", params + [limit]))
+    conditions, params, limit = client.get_read_conditions("search_logs", READ_REQUESTS[2][1])
+    checks.append(("search_logs (page)", f"""{select}
+        WHERE {conditions} ORDER BY log_time, id LIMIT %s""", params + [limit]))
+    conditions, params, limit = client.get_read_conditions("get_logs_by_test_item", READ_REQUESTS[1][1])
+    page_checks = [("get_logs_by_test_item (page)", f"""{select}
+        WHERE {conditions} AND (log_time, id) > (%s::timestamp, %s)
+        ORDER BY log_time, id LIMIT %s""", params + ["2021-05-04", 0, limit], "_project_item_time_idx")]
+    checks.append(("delete_logs_by_date", f"""SELECT id FROM {client.rp_logs_name}
+        WHERE log_time >= %s AND log_time <= %s AND project = %s""",
+                   ["2021-05-04", "2021-05-07", args.project]))
+    results = [check_query(client, name, query, params) for name, query, params in checks]
+    results.extend(check_query(client, name, query, params, index_suffix=index_suffix)
+                   for name, query, params, index_suffix in page_checks)
+    client.pool.close_all()
+    if not all(results):
+        sys.exit(1)
+
+
+perform_testing()
@@ -0,0 +1,107 @@
+import argparse
+import json
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append('..')
+
+from commons.es_client import EsClient
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--nodes', default=3)
+parser.add_argument('--query_num', default=300)
+parser.add_argument('--concurrency', default=8)
+parser.add_argument('--selector', default="round_robin")
+args = parser.parse_args()
+
+args.nodes = int(args.nodes)
+args.query_num = int(args.query_num)
+args.concurrency = int(args.concurrency)
+print("Nodes: ", args.nodes)
+print("Query num: ", args.query_num)
+print("Selector: ", args.selector)
+
+served = Counter()
+served_lock = threading.Lock()
+
+
+class StubNodeHandler(BaseHTTPRequestHandler):
+    """Answers index checks and searches like an Elasticsearch node holding one log,
+    a node that is down drops its open keep-alive connections without answering"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *log_args):
+        pass
+
+    def send_json(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def handle_request(self):
+        if self.server.down:
+            self.close_connection = True
+            return
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with served_lock:
+            served[self.server.server_port] += 1
+        self.send_json({"hits": {"hits": [{"_id": "1", "_source": {
+            "log_message": f"served by {self.server.server_port}", "item_id": 1}}]}})
+
+    do_HEAD = do_GET = do_POST = handle_request
+
+
+def start_node():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubNodeHandler)
+    server.down = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_reads(client, query_num):
+    def read(idx):
+        return client.get_logs_by_ids({"ids": [idx], "project": 1})
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        return sum(len(logs) == 1 for logs in executor.map(read, range(query_num)))
+
+
+def perform_testing():
+    nodes = [start_node() for _ in range(args.nodes)]
+    client = EsClient({
+        "esHost": ",".join(f"http://127.0.0.1:{node.server_port}" for node in nodes),
+        "esIndexPrefix": "",
+        "esIndexCacheTtl": 0,
+        "esMaxRetries": args.nodes,
+        "esSelector": args.selector,
+        "esHttpCompress": False,
+    })
+    succeeded = run_reads(client, args.query_num)
+    print(json.dumps({"phase": "all nodes up", "succeeded": succeeded, "served": dict(served)}))
+    balanced = len(served) == args.nodes
+
+    dead_node = nodes[0]
+    dead_node.down = True
+    dead_node.shutdown()
+    dead_node.server_close()
+    served.clear()
+    succeeded_after_failure = run_reads(client, args.query_num)
+    node_metrics = client.get_node_metrics()
+    print(json.dumps({"phase": "one node down", "succeeded": succeeded_after_failure,
+                      "served": dict(served), "node_metrics": node_metrics}))
+    for node in nodes[1:]:
+        node.shutdown()
+        node.server_close()
+    passed = all([balanced, succeeded == args.query_num, succeeded_after_failure == args.query_num,
+                  dead_node.server_port not in served, node_metrics["dead_nodes"] == 1])
+    print(json.dumps({"passed": passed}))
+    if not passed:
+        sys.exit(1)
+
+
+perform_testing()
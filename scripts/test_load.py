@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--workers', default="1,2,4,8")
+parser.add_argument('--threads', default=8)
+parser.add_argument('--web_server', default="waitress")
+parser.add_argument('--endpoint', default="get_logs_by_test_item")
+parser.add_argument('--body', default='{"test_item": 5000, "project": 100}')
+parser.add_argument('--concurrency', default=64)
+parser.add_argument('--duration', default=30)
+parser.add_argument('--port', default=5010)
+parser.add_argument('--database_type', default="elasticsearch")
+parser.add_argument('--metrics_folder', default="../tmp/metrics")
+args = parser.parse_args()
+
+args.threads = int(args.threads)
+args.concurrency = int(args.concurrency)
+args.duration = float(args.duration)
+args.port = int(args.port)
+print("Workers: ", args.workers)
+print("Web server: ", args.web_server)
+print("Endpoint: ", args.endpoint)
+print("Concurrency: ", args.concurrency)
+print("Duration: ", args.duration)
+print("Database type: ", args.database_type)
+
+APP_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def start_server(workers):
+    env = os.environ.copy()
+    env.update({
+        "WEB_SERVER": args.web_server,
+        "WEB_WORKERS": str(workers),
+        "WEB_THREADS": str(args.threads),
+        "WEB_PORT": str(args.port),
+        "DATABASE_TYPE": args.database_type,
+        "LOGGING_LEVEL": "error",
+    })
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=APP_FOLDER, env=env)
+    for _ in range(100):
+        try:
+            requests.get(f"http://localhost:{args.port}/", timeout=1)
+            return process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("The server didn't start")
+
+
+def run_client(session, deadline):
+    requests_done = 0
+    errors = 0
+    latencies = []
+    while time.time() < deadline:
+        start_time = time.time()
+        res = session.post(
+            f"http://localhost:{args.port}/{args.endpoint}",
+            data=args.body,
+            headers={"Content-type": "application/json", "Accept": "text/plain"},
+        )
+        latencies.append(time.time() - start_time)
+        requests_done += 1
+        if res.status_code != 200:
+            errors += 1
+    return requests_done, errors, latencies
+
+
+def measure_workers(workers):
+    process = start_server(workers)
+    try:
+        deadline = time.time() + args.duration
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(run_client, requests.Session(), deadline)
+                       for _ in range(args.concurrency)]
+            results = [future.result() for future in futures]
+    finally:
+        process.terminate()
+        process.wait()
+    requests_done = sum(res[0] for res in results)
+    latencies = sorted(latency for res in results for latency in res[2])
+    result = {
+        "workers": workers,
+        "requests": requests_done,
+        "errors": sum(res[1] for res in results),
+        "rps": requests_done / args.duration,
+        "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+        "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else None,
+    }
+    print(json.dumps(result))
+    return result
+
+
+def perform_testing():
+    os.makedirs(args.metrics_folder, exist_ok=True)
+    performance_result = args.__dict__.copy()
+    performance_result["performance_results"] = [
+        measure_workers(int(workers)) for workers in args.workers.split(",")]
+    pickle.dump(performance_result, open(os.path.join(
+        args.metrics_folder, "load_{}_{}_{}.pickle".format(
+            args.web_server, args.endpoint, args.database_type
+        )), "wb"))
+
+
+perform_testing()
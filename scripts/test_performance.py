@@ -21,10 +21,12 @@ parser.add_argument('--method')
 parser.add_argument('--database_type', default="elasticsearch")
 parser.add_argument('--data_folder', default="../tmp/mckc-auto")
 parser.add_argument('--metrics_folder', default="../tmp/metrics")
+parser.add_argument('--page_size', default=1000)
 args = parser.parse_args()
 
 args.data_size = int(args.data_size)
 args.query_num = int(args.query_num)
+args.page_size = int(args.page_size)
 print("Data size: ", args.data_size)
 print("Query num: ", args.query_num)
 print("Method: ", args.method)
@@ -145,8 +147,6 @@ def search_logs(num_queries, project_id):
         else:
             start_pos = np.random.randint(0, len(words_in_query) - 5)
         str_query = " ".join(words_in_query[start_pos: start_pos + np.random.randint(5, 10)])
-        if args.database_type == "postgres":
-            str_query = str_query.replace("'", "\"")
         print(str_query)
         start_time = time.time()
         res, reason = make_logs_post_request_with_returned_data(
@@ -208,7 +208,8 @@ def delete_logs(num_queries, project_id):
         for query in range(num_queries):
             log_ids = choose_ids(existing_ids, num_ids)
             start_time = time.time()
-            make_logs_post_request("delete_logs", {"ids": log_ids, "project": project_id})
+            make_logs_post_request(
+                "delete_logs", {"ids": log_ids, "project": project_id, "wait_for_completion": True})
             time_spent = time.time() - start_time
             results.append(time_spent)
             make_logs_post_request(
@@ -238,7 +239,8 @@ def delete_logs_by_date(num_queries, project_id):
             "delete_logs_by_date",
             {"start_date": start_date.strftime("%Y-%m-%d"),
              "end_date": end_date.strftime("%Y-%m-%d"),
-             "project": project_id})
+             "project": project_id,
+             "wait_for_completion": True})
         time_spent = time.time() - start_time
         deleted_num = args.data_size // DATES_RANGE_NUM * offset_between_dates
         make_logs_post_request(
@@ -248,6 +250,47 @@ def delete_logs_by_date(num_queries, project_id):
     return get_performance_result_template(performance_result)
 
 
+def page_logs(num_queries, project_id, test_item=777):
+    """Pages through all logs of one test item, the latency of deep pages
+    should stay the same as the latency of the first one"""
+    logs = generate_logs(args.data_size)
+    for log in logs:
+        log["item_id"] = test_item
+    print("Dropping existing logs: ", end="")
+    print(make_logs_post_request("delete_project", project_id)["reason"])
+    for i in range(0, len(logs), 10000):
+        make_logs_post_request("index_logs", {"logs": logs[i: i + 10000], "project": project_id})
+    performance_result = []
+    for query in range(num_queries):
+        cursor = None
+        page_times = []
+        res_num = 0
+        while True:
+            start_time = time.time()
+            res, reason = make_logs_post_request_with_returned_data(
+                "get_logs_by_test_item",
+                {"test_item": test_item, "project": project_id, "limit": args.page_size, "cursor": cursor})
+            page_times.append(time.time() - start_time)
+            if not isinstance(res, dict) or "logs" not in res:
+                print(reason)
+                break
+            res_num += len(res["logs"])
+            cursor = res["cursor"]
+            if cursor is None:
+                break
+        print("Paged %d logs in %d pages, first page %.3f s, last page %.3f s" % (
+            res_num, len(page_times), page_times[0], page_times[-1]))
+        performance_result.append({
+            "res_num": res_num,
+            "pages": len(page_times),
+            "page_time_spent": page_times,
+            "first_page_time_spent": page_times[0],
+            "last_page_time_spent": page_times[-1],
+            "time_spent": sum(page_times),
+        })
+    return get_performance_result_template(performance_result)
+
+
 def generate_logs(num, log_ids=None, add_id=False):
     all_logs = []
     if log_ids is None:
@@ -289,6 +332,8 @@ def perform_testing(method):
         performance_result = delete_logs(args.query_num, 100)
     if method == "delete_logs_by_date":
         performance_result = delete_logs_by_date(args.query_num, 100)
+    if method == "page_logs":
+        performance_result = page_logs(args.query_num, 101)
     pickle.dump(performance_result, open(os.path.join(
         args.metrics_folder, "{}_{}_{}_{}.pickle".format(
             args.method, args.database_type, args.data_size, args.query_num
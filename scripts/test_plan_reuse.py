@@ -0,0 +1,84 @@
+import argparse
+import json
+import random
+import sys
+sys.path.append('..')
+
+from commons.postgres_client import PostgresClient
+from postgres_config import POSTGRES_CONFIG
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--project', default=100)
+parser.add_argument('--query_num', default=200)
+args = parser.parse_args()
+
+args.project = int(args.project)
+args.query_num = int(args.query_num)
+print("Project: ", args.project)
+print("Query num: ", args.query_num)
+
+# one connection runs every read, so its prepared statements can be checked
+APP_CONFIG = dict(POSTGRES_CONFIG, postgresPoolSize=1)
+
+WORDS = ["assertion", "error", "timeout", "expected", "it's", "null", "connection", "failed"]
+
+
+def run_reads(client):
+    for _ in range(args.query_num):
+        client.get_logs_by_ids({
+            "ids": random.sample(range(1, 100000), random.randint(1, 50)), "project": args.project})
+        client.get_logs_by_test_item({"test_item": random.randint(1, 10000), "project": args.project})
+        client.search_logs({"query": " ".join(random.sample(WORDS, 3)), "project": args.project})
+        client.search_logs_by_pattern({"query": random.choice(WORDS) + ".*", "project": args.project})
+
+
+def get_read_statements(client):
+    """Returns the prepared statement names of the reads run by run_reads"""
+    read_request = {"ids": [1], "test_item": 1, "query": WORDS[0], "project": args.project}
+    return {operation: client.get_prepared_statement(client.get_read_query(operation, read_request)[0])[0]
+            for operation in ["get_logs_by_ids", "get_logs_by_test_item", "search_logs",
+                              "search_logs_by_pattern"]}
+
+
+def perform_testing():
+    """Needs pg_stat_statements preloaded, as in the postgres service of docker-compose.yml.
+    Passes if every read runs as EXECUTE of a statement prepared once on the connection"""
+    client = PostgresClient(APP_CONFIG)
+    if not client.ensure_schema():
+        raise RuntimeError("Unable to initialize the schema")
+    client.commit_to_db("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+    client.commit_to_db("SELECT pg_stat_statements_reset()")
+    run_reads(client)
+    _, rows = client.query_rows("""
+        SELECT query, calls, mean_time FROM pg_stat_statements
+         WHERE query LIKE %s AND query NOT LIKE %s
+         ORDER BY calls DESC""", ["%rp_logs%", "%pg_stat_statements%"])
+    for query, calls, mean_time in rows:
+        print(json.dumps({"query": " ".join(query.split())[:120], "calls": calls, "mean_time": mean_time}))
+    _, prepared_rows = client.query_rows("SELECT name FROM pg_prepared_statements")
+    prepared_names = {name for name, in prepared_rows}
+    # executions of a prepared statement are counted under its PREPARE text
+    prepare_rows = [(query.split(), calls) for query, calls, _ in rows
+                    if query.lstrip().upper().startswith("PREPARE")]
+    statements = {}
+    for operation, name in get_read_statements(client).items():
+        statements[operation] = {
+            "name": name,
+            "prepared": name in prepared_names,
+            "calls": sum(calls for words, calls in prepare_rows if words[1] == name),
+        }
+    passed = all(statement["prepared"] and statement["calls"] >= args.query_num
+                 for statement in statements.values())
+    print(json.dumps({
+        "reads": args.query_num * 4,
+        "distinct_statements": len(rows),
+        "calls": sum(row[1] for row in rows),
+        "statements": statements,
+        "passed": passed,
+    }))
+    client.pool.close_all()
+    if not passed:
+        sys.exit(1)
+
+
+perform_testing()
@@ -0,0 +1,53 @@
+import argparse
+import datetime
+import json
+import sys
+import time
+import uuid
+sys.path.append('../commons')
+
+import launch_objects
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--rows', default=1000)
+parser.add_argument('--repeats', default=20)
+args = parser.parse_args()
+
+args.rows = int(args.rows)
+args.repeats = int(args.repeats)
+print("Rows: ", args.rows)
+print("Repeats: ", args.repeats)
+
+
+def generate_rows(num):
+    rows = []
+    cur_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for _id in range(num):
+        rows.append((str(_id), str(uuid.uuid4()), cur_date, "java.lang.AssertionError: expected true " * 20,
+                     5000, 500, cur_date, 40000, 5000))
+    return rows
+
+
+def serialize_pydantic(rows):
+    logs = [launch_objects.Log(**dict(zip(launch_objects.LOG_FIELDS, row))) for row in rows]
+    return json.dumps([log.json() for log in logs])
+
+
+def serialize_log_rows(rows):
+    logs = [launch_objects.LogRow.from_tuple(row) for row in rows]
+    return "[" + ",".join(log.json() for log in logs) + "]"
+
+
+def measure(serialize, rows):
+    time_spent = []
+    for _ in range(args.repeats):
+        start_time = time.time()
+        serialize(rows)
+        time_spent.append(time.time() - start_time)
+    return min(time_spent), sum(time_spent) / len(time_spent)
+
+
+rows = generate_rows(args.rows)
+for name, serialize in [("pydantic Log", serialize_pydantic), ("LogRow + orjson", serialize_log_rows)]:
+    best, average = measure(serialize, rows)
+    print("%s: best %.4f s, average %.4f s per %d rows" % (name, best, average, args.rows))
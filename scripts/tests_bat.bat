@@ -1,2 +1,3 @@
 call python test_performance.py --data_folder "C:\Users\Maryia_Ivanina\report_portal\auto-analysis-poc\tmp\mckc-auto" --method "get_logs_by_ids" --data_size 10000000 --query_num 100
-call python test_performance.py --data_folder "C:\Users\Maryia_Ivanina\report_portal\auto-analysis-poc\tmp\mckc-auto" --method "search_logs_by_pattern" --data_size 10000000 --query_num 100
\ No newline at end of file
+call python test_performance.py --data_folder "C:\Users\Maryia_Ivanina\report_portal\auto-analysis-poc\tmp\mckc-auto" --method "search_logs_by_pattern" --data_size 10000000 --query_num 100
+call python test_performance.py --data_folder "C:\Users\Maryia_Ivanina\report_portal\auto-analysis-poc\tmp\mckc-auto" --method "page_logs" --data_size 1000000 --query_num 3 --page_size 1000
\ No newline at end of file
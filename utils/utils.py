@@ -14,12 +14,25 @@
 * limitations under the License.
 """
 
+import base64
+import json
 import re
+from datetime import date
 from urllib.parse import urlparse
 import string
 
 
+def get_credentials_from_url(url):
+    """Returns (user, password) of a url, so nodes found by sniffing get the same credentials"""
+    parsed_url = urlparse(url)
+    if parsed_url.username is None:
+        return None
+    return parsed_url.username, parsed_url.password or ""
+
+
 def remove_credentials_from_url(url):
+    if "," in url:
+        return ",".join(remove_credentials_from_url(part.strip()) for part in url.split(","))
     parsed_url = urlparse(url)
     new_netloc = re.sub("^.+?:.+?@", "", parsed_url.netloc)
     return url.replace(parsed_url.netloc, new_netloc)
@@ -45,3 +58,43 @@ def split_words(text, min_word_length=0, only_unique=False, split_urls=True,
                     all_unique_words.add(w)
                     all_words.append(w)
     return all_words
+
+
+def encode_cursor(page_state):
+    return base64.urlsafe_b64encode(json.dumps(page_state).encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor):
+    try:
+        page_state = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if not isinstance(page_state, dict):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return page_state
+
+
+def get_read_limit(read_request, default_limit, max_limit=10000):
+    """Returns the number of logs a read request asks for, bounded by max_limit"""
+    limit = read_request.get("limit")
+    if limit is None:
+        return default_limit
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid limit '{limit}'")
+    if limit < 1 or limit > max_limit:
+        raise ValueError(f"The limit should be between 1 and {max_limit}")
+    return limit
+
+
+def get_month_start(value):
+    """Returns the first day of the month of a 'YYYY-MM-DD...' date string or a date"""
+    if isinstance(value, str):
+        return date(int(value[:4]), int(value[5:7]), 1)
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    month_idx = month.year * 12 + month.month - 1 + count
+    return date(month_idx // 12, month_idx % 12 + 1, 1)